@@ -1,12 +1,11 @@
 import json
-import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
+import db
+import session
 
 def handler(event: dict, context) -> dict:
-    '''API для администраторов: управление пользователями, блокировки IP и пользователей'''
+    '''API для администраторов: управление пользователями, блокировки IP и пользователей, статистика'''
     method = event.get('httpMethod', 'GET')
-    headers = event.get('headers', {})
     
     if method == 'OPTIONS':
         return {
@@ -14,7 +13,7 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Db-Lsn',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -22,30 +21,13 @@ def handler(event: dict, context) -> dict:
         }
     
     try:
-        admin_id = headers.get('x-admin-id') or headers.get('X-Admin-Id')
-        
-        if not admin_id:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Admin authentication required'}),
-                'isBase64Encoded': False
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        claims = session.token_claims(event)
+        conn = db.connect_read(context, event) if method == 'GET' else db.connect(context)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        cur.execute("SELECT is_admin FROM users WHERE id = %s", (admin_id,))
-        admin_check = cur.fetchone()
-        
-        if not admin_check or not admin_check['is_admin']:
-            conn.close()
-            return {
-                'statusCode': 403,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Admin privileges required'}),
-                'isBase64Encoded': False
-            }
+        claims = session.authenticate(claims, cur)
+        session.require_admin(claims)
+        admin_id = claims['sub']
         
         if method == 'GET':
             query_params = event.get('queryStringParameters') or {}
@@ -102,6 +84,60 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            elif action == 'stats':
+                # Только таблицы-счётчики из V0011: базовые таблицы здесь не читаются
+                days = min(max(int(query_params.get('days', 30)), 1), 365)
+                
+                cur.execute("""
+                    SELECT metric, SUM(value) AS value
+                    FROM stats_daily
+                    WHERE metric IN ('users_new', 'users_blocked', 'tickets_open')
+                    GROUP BY metric
+                """)
+                totals = {row['metric']: int(row['value']) for row in cur.fetchall()}
+                
+                cur.execute("""
+                    SELECT day, metric, SUM(value) AS value
+                    FROM stats_daily
+                    WHERE metric IN ('messages', 'active_users', 'users_new', 'tickets_opened', 'tickets_closed')
+                      AND day > CURRENT_DATE - %s
+                    GROUP BY day, metric
+                """, (days,))
+                rows = cur.fetchall()
+                
+                cur.execute("SELECT reconciled_at FROM stats_state")
+                state = cur.fetchone()
+                conn.close()
+                
+                series = {}
+                for row in rows:
+                    series.setdefault(row['day'].isoformat(), {})[row['metric']] = int(row['value'])
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'totals': {
+                            'users': totals.get('users_new', 0),
+                            'blocked_users': totals.get('users_blocked', 0),
+                            'open_tickets': totals.get('tickets_open', 0)
+                        },
+                        'series': [
+                            {
+                                'day': day,
+                                'messages': series[day].get('messages', 0),
+                                'active_users': series[day].get('active_users', 0),
+                                'new_users': series[day].get('users_new', 0),
+                                'tickets_opened': series[day].get('tickets_opened', 0),
+                                'tickets_closed': series[day].get('tickets_closed', 0)
+                            }
+                            for day in sorted(series)
+                        ],
+                        'reconciled_at': state['reconciled_at'].isoformat() if state and state['reconciled_at'] else None
+                    }),
+                    'isBase64Encoded': False
+                }
+            
             elif action == 'admin_actions':
                 limit = int(query_params.get('limit', 100))
                 cur.execute("""
@@ -154,12 +190,12 @@ def handler(event: dict, context) -> dict:
                     (admin_id, 'block_user', user_id, json.dumps({'reason': reason}))
                 )
                 
-                conn.commit()
+                lsn_headers = db.commit(conn)
                 conn.close()
                 
                 return {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                     'body': json.dumps({'success': True, 'message': 'User blocked'}),
                     'isBase64Encoded': False
                 }
@@ -185,12 +221,12 @@ def handler(event: dict, context) -> dict:
                     (admin_id, 'unblock_user', user_id)
                 )
                 
-                conn.commit()
+                lsn_headers = db.commit(conn)
                 conn.close()
                 
                 return {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                     'body': json.dumps({'success': True, 'message': 'User unblocked'}),
                     'isBase64Encoded': False
                 }
@@ -217,12 +253,12 @@ def handler(event: dict, context) -> dict:
                     (admin_id, 'block_ip', ip_address, json.dumps({'reason': reason}))
                 )
                 
-                conn.commit()
+                lsn_headers = db.commit(conn)
                 conn.close()
                 
                 return {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                     'body': json.dumps({'success': True, 'message': 'IP blocked'}),
                     'isBase64Encoded': False
                 }
@@ -248,12 +284,12 @@ def handler(event: dict, context) -> dict:
                     (admin_id, 'unblock_ip', ip_address)
                 )
                 
-                conn.commit()
+                lsn_headers = db.commit(conn)
                 conn.close()
                 
                 return {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                     'body': json.dumps({'success': True, 'message': 'IP unblocked'}),
                     'isBase64Encoded': False
                 }
@@ -265,6 +301,13 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
         
+    except session.SessionError as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
     except Exception as e:
         return {
             'statusCode': 500,
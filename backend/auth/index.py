@@ -1,7 +1,9 @@
 import json
-import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
+import db
+import session
+
+db.statement('auth_lookup', "SELECT id, username, phone, display_name, bio, avatar_url, is_blocked, blocked_reason, is_admin FROM users WHERE username = %s OR phone = %s")
 
 def handler(event: dict, context) -> dict:
     '''API для регистрации и авторизации пользователей'''
@@ -41,13 +43,10 @@ def handler(event: dict, context) -> dict:
                 'isBase64Encoded': False
             }
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = db.connect(context)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        cur.execute(
-            "SELECT id, username, phone, display_name, bio, avatar_url, is_blocked, blocked_reason, is_admin FROM users WHERE username = %s OR phone = %s",
-            (username, phone)
-        )
+        db.execute(cur, 'auth_lookup', (username, phone))
         user = cur.fetchone()
         
         if user and user['is_blocked']:
@@ -71,13 +70,15 @@ def handler(event: dict, context) -> dict:
                     'display_name': user['display_name'],
                     'bio': user['bio'],
                     'avatar_url': user['avatar_url'],
-                    'is_admin': user['is_admin']
+                    'is_admin': user['is_admin'],
+                    'token': session.issue(user),
+                    'expires_in': session.SESSION_TTL
                 }),
                 'isBase64Encoded': False
             }
         
         cur.execute(
-            "INSERT INTO users (username, phone, display_name) VALUES (%s, %s, %s) RETURNING id, username, phone, display_name, bio, avatar_url",
+            "INSERT INTO users (username, phone, display_name) VALUES (%s, %s, %s) RETURNING id, username, phone, display_name, bio, avatar_url, is_admin, is_blocked",
             (username, phone, display_name)
         )
         new_user = cur.fetchone()
@@ -93,7 +94,9 @@ def handler(event: dict, context) -> dict:
                 'phone': new_user['phone'],
                 'display_name': new_user['display_name'],
                 'bio': new_user['bio'],
-                'avatar_url': new_user['avatar_url']
+                'avatar_url': new_user['avatar_url'],
+                'token': session.issue(new_user),
+                'expires_in': session.SESSION_TTL
             }),
             'isBase64Encoded': False
         }
@@ -0,0 +1,151 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+# Каждая функция деплоится отдельно, поэтому модуль лежит копией в каждой папке backend/*.
+# Меняйте все копии вместе.
+
+SESSION_TTL = int(os.environ.get('SESSION_TTL', '86400'))
+REVOCATION_REFRESH = float(os.environ.get('SESSION_REVOCATION_REFRESH', '15'))
+
+_revocations = {}
+_revocations_loaded_at = None
+
+
+class SessionError(Exception):
+    '''Токен отсутствует, подделан, просрочен или отозван'''
+
+    def __init__(self, message: str, status_code: int = 401):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def _keys() -> list:
+    '''Ключи из SESSION_KEYS вида "kid:secret,kid:secret": первым подписываем, остальными только проверяем'''
+    keys = []
+    for item in os.environ.get('SESSION_KEYS', '').split(','):
+        kid, _, secret = item.strip().partition(':')
+        if kid and secret:
+            keys.append((kid, secret.encode('utf-8')))
+    if not keys:
+        raise RuntimeError('SESSION_KEYS is not configured')
+    return keys
+
+
+def _sign(key: bytes, signing_input: str) -> str:
+    return _b64encode(hmac.new(key, signing_input.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue(user: dict) -> str:
+    '''Выпускает подписанный токен (HS256 JWT) с id, флагом админа и блокировкой'''
+    kid, key = _keys()[0]
+    now = time.time()
+    header = {'alg': 'HS256', 'typ': 'JWT', 'kid': kid}
+    claims = {
+        'sub': user['id'],
+        'adm': bool(user.get('is_admin')),
+        'blk': bool(user.get('is_blocked')),
+        'iat': round(now, 3),
+        'exp': int(now + SESSION_TTL)
+    }
+    signing_input = '.'.join(
+        _b64encode(json.dumps(part, separators=(',', ':')).encode('utf-8'))
+        for part in (header, claims)
+    )
+    return f'{signing_input}.{_sign(key, signing_input)}'
+
+
+def decode(token: str) -> dict:
+    '''Проверяет подпись и срок действия без обращения к БД'''
+    try:
+        header_b64, claims_b64, signature = token.split('.')
+        header = json.loads(_b64decode(header_b64))
+        claims = json.loads(_b64decode(claims_b64))
+    except (ValueError, TypeError):
+        raise SessionError('Malformed session token')
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise SessionError('Malformed session token')
+    if not isinstance(header.get('kid'), str) or not isinstance(header.get('alg'), str):
+        raise SessionError('Malformed session token')
+
+    key = dict(_keys()).get(header.get('kid'))
+    if key is None or header.get('alg') != 'HS256':
+        raise SessionError('Unknown session key')
+
+    if not hmac.compare_digest(signature.encode('utf-8'), _sign(key, f'{header_b64}.{claims_b64}').encode('ascii')):
+        raise SessionError('Invalid session token')
+
+    if claims.get('exp', 0) < time.time():
+        raise SessionError('Session expired')
+
+    return claims
+
+
+REVOCATIONS_SQL = "SELECT user_id, EXTRACT(EPOCH FROM revoked_at) AS revoked_at FROM session_revocations WHERE revoked_at > NOW() - make_interval(secs => %s)"
+
+
+def _store_revocations(rows) -> None:
+    global _revocations, _revocations_loaded_at
+    _revocations = {row[0]: float(row[1]) for row in rows}
+    _revocations_loaded_at = time.monotonic()
+
+
+def _revocations_stale() -> bool:
+    return _revocations_loaded_at is None or time.monotonic() - _revocations_loaded_at > REVOCATION_REFRESH
+
+
+def _token(event: dict) -> str:
+    headers = event.get('headers') or {}
+    token = headers.get('x-auth-token') or headers.get('X-Auth-Token')
+    if not token:
+        raise SessionError('Authentication required')
+    return token
+
+
+def token_claims(event: dict) -> dict:
+    '''Claims из X-Auth-Token после проверки подписи и срока; вызывается до того, как обработчик возьмёт соединение с БД'''
+    return decode(_token(event))
+
+
+def _check(claims: dict) -> dict:
+    revoked_at = _revocations.get(claims['sub'])
+    if revoked_at is not None and claims['iat'] <= revoked_at:
+        raise SessionError('Session revoked')
+
+    if claims.get('blk'):
+        raise SessionError('Account blocked', 403)
+
+    return claims
+
+
+def authenticate(claims: dict, cur) -> dict:
+    '''Проверяет claims из token_claims по списку отзыва; список перечитывается не чаще раза в REVOCATION_REFRESH секунд'''
+    if _revocations_stale():
+        cur.execute(REVOCATIONS_SQL, (SESSION_TTL,))
+        _store_revocations((row['user_id'], row['revoked_at']) for row in cur.fetchall())
+
+    return _check(claims)
+
+
+async def authenticate_async(claims: dict, conn) -> dict:
+    '''То же для asyncpg-соединения (асинхронный путь шлюза)'''
+    if _revocations_stale():
+        _store_revocations(await conn.fetch(REVOCATIONS_SQL.replace('%s', '$1'), float(SESSION_TTL)))
+
+    return _check(claims)
+
+
+def require_admin(claims: dict) -> None:
+    if not claims.get('adm'):
+        raise SessionError('Admin privileges required', 403)
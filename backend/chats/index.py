@@ -1,10 +1,48 @@
 import json
-import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
+import db
+import session
+
+# В каналах участники не перечисляются (см. action=members), а непрочитанное считается
+# по отметке подписчика last_read_message_id вместо массивов read_by
+db.statement('chats_list', """
+    SELECT
+        c.id,
+        c.type,
+        c.name,
+        c.avatar_url,
+        (SELECT text FROM messages WHERE chat_id = c.id ORDER BY created_at DESC LIMIT 1) as last_message,
+        (SELECT created_at FROM messages WHERE chat_id = c.id ORDER BY created_at DESC LIMIT 1) as last_message_time,
+        CASE WHEN c.type = 'channel'
+             THEN (SELECT COUNT(*) FROM messages m WHERE m.chat_id = c.id AND m.id > me.last_read_message_id)
+             ELSE (SELECT COUNT(*) FROM messages m WHERE m.chat_id = c.id AND NOT (%s = ANY(m.read_by)))
+        END as unread_count,
+        CASE WHEN c.type = 'channel' THEN NULL
+             ELSE (SELECT json_agg(json_build_object('id', u.id, 'username', u.username, 'display_name', u.display_name, 'avatar_url', u.avatar_url))
+                   FROM chat_members cm
+                   JOIN users u ON u.id = cm.user_id
+                   WHERE cm.chat_id = c.id AND cm.user_id != %s)
+        END as members,
+        (SELECT COALESCE(SUM(value), 0) FROM chat_member_counts WHERE chat_id = c.id) as member_count
+    FROM chats c
+    JOIN chat_members me ON me.chat_id = c.id
+    WHERE me.user_id = %s
+    ORDER BY last_message_time DESC NULLS LAST
+""")
+db.statement('chat_members_page', """
+    SELECT u.id, u.username, u.display_name, u.avatar_url, cm.role
+    FROM chat_members cm
+    JOIN users u ON u.id = cm.user_id
+    WHERE cm.chat_id = %s AND cm.user_id > %s
+      AND EXISTS (SELECT 1 FROM chat_members me WHERE me.chat_id = %s AND me.user_id = %s)
+    ORDER BY cm.user_id
+    LIMIT %s
+""")
+
+MEMBERS_PAGE_MAX = 200
 
 def handler(event: dict, context) -> dict:
-    '''API для работы с чатами: создание, получение списка, поиск пользователей'''
+    '''API для работы с чатами: создание, получение списка, поиск пользователей, подписка на каналы'''
     method = event.get('httpMethod', 'GET')
     path = event.get('queryStringParameters') or {}
     
@@ -14,35 +52,31 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Db-Lsn'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        claims = session.token_claims(event)
+        data = json.loads(event.get('body', '{}')) if method == 'POST' else {}
+        read_only = method == 'GET' or data.get('action') == 'search_users'
+        conn = db.connect_read(context, event) if read_only else db.connect(context)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
+        claims = session.authenticate(claims, cur)
+        
         if method == 'POST':
-            data = json.loads(event.get('body', '{}'))
             action = data.get('action')
             
             if action == 'create_chat':
                 chat_type = data.get('type', 'chat')
                 name = data.get('name', '').strip()
                 description = data.get('description', '').strip()
-                created_by = data.get('created_by')
+                created_by = claims['sub']
                 member_ids = data.get('member_ids', [])
                 
-                if not created_by:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'created_by is required'}),
-                        'isBase64Encoded': False
-                    }
-                
                 cur.execute(
                     "INSERT INTO chats (type, name, description, created_by) VALUES (%s, %s, %s, %s) RETURNING id",
                     (chat_type, name, description, created_by)
@@ -61,16 +95,53 @@ def handler(event: dict, context) -> dict:
                             (chat_id, member_id, 'member')
                         )
                 
-                conn.commit()
+                lsn_headers = db.commit(conn)
                 conn.close()
                 
                 return {
                     'statusCode': 201,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                     'body': json.dumps({'chat_id': chat_id}),
                     'isBase64Encoded': False
                 }
             
+            elif action in ('subscribe', 'unsubscribe'):
+                chat_id = data.get('chat_id')
+                
+                if not chat_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'chat_id is required'}),
+                        'isBase64Encoded': False
+                    }
+                
+                if action == 'subscribe':
+                    # Новый подписчик видит непрочитанным только то, что выйдет после подписки
+                    cur.execute("""
+                        INSERT INTO chat_members (chat_id, user_id, role, last_read_message_id)
+                        SELECT c.id, %s, 'member', COALESCE((SELECT MAX(id) FROM messages WHERE chat_id = c.id), 0)
+                        FROM chats c
+                        WHERE c.id = %s AND c.type = 'channel'
+                        ON CONFLICT (chat_id, user_id) DO NOTHING
+                        RETURNING id
+                    """, (claims['sub'], chat_id))
+                else:
+                    cur.execute(
+                        "DELETE FROM chat_members WHERE chat_id = %s AND user_id = %s AND role = 'member' RETURNING id",
+                        (chat_id, claims['sub'])
+                    )
+                changed = cur.fetchone() is not None
+                lsn_headers = db.commit(conn)
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
+                    'body': json.dumps({'success': True, 'changed': changed}),
+                    'isBase64Encoded': False
+                }
+            
             elif action == 'search_users':
                 query = data.get('query', '').strip().lower()
                 
@@ -97,34 +168,36 @@ def handler(event: dict, context) -> dict:
                 }
         
         elif method == 'GET':
-            user_id = path.get('user_id')
+            user_id = claims['sub']
             
-            if not user_id:
+            if path.get('action') == 'members':
+                chat_id = path.get('chat_id')
+                after = int(path.get('after', 0))
+                limit = min(int(path.get('limit', 50)), MEMBERS_PAGE_MAX)
+                
+                if not chat_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'chat_id is required'}),
+                        'isBase64Encoded': False
+                    }
+                
+                db.execute(cur, 'chat_members_page', (chat_id, after, chat_id, user_id, limit))
+                members = [dict(m) for m in cur.fetchall()]
+                conn.close()
+                
                 return {
-                    'statusCode': 400,
+                    'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'user_id is required'}),
+                    'body': json.dumps({
+                        'members': members,
+                        'next_after': members[-1]['id'] if len(members) == limit else None
+                    }),
                     'isBase64Encoded': False
                 }
             
-            cur.execute("""
-                SELECT 
-                    c.id,
-                    c.type,
-                    c.name,
-                    c.avatar_url,
-                    (SELECT text FROM messages WHERE chat_id = c.id ORDER BY created_at DESC LIMIT 1) as last_message,
-                    (SELECT created_at FROM messages WHERE chat_id = c.id ORDER BY created_at DESC LIMIT 1) as last_message_time,
-                    (SELECT COUNT(*) FROM messages m WHERE m.chat_id = c.id AND NOT (%s = ANY(m.read_by))) as unread_count,
-                    (SELECT json_agg(json_build_object('id', u.id, 'username', u.username, 'display_name', u.display_name, 'avatar_url', u.avatar_url))
-                     FROM chat_members cm 
-                     JOIN users u ON u.id = cm.user_id 
-                     WHERE cm.chat_id = c.id AND cm.user_id != %s) as members
-                FROM chats c
-                JOIN chat_members cm ON cm.chat_id = c.id
-                WHERE cm.user_id = %s
-                ORDER BY last_message_time DESC NULLS LAST
-            """, (user_id, user_id, user_id))
+            db.execute(cur, 'chats_list', (user_id, user_id, user_id))
             
             chats = cur.fetchall()
             conn.close()
@@ -132,6 +205,8 @@ def handler(event: dict, context) -> dict:
             result = []
             for chat in chats:
                 chat_dict = dict(chat)
+                if chat_dict['last_message_time']:
+                    chat_dict['last_message_time'] = chat_dict['last_message_time'].isoformat()
                 if chat_dict['members']:
                     chat_dict['members'] = chat_dict['members']
                 else:
@@ -152,6 +227,13 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
         
+    except session.SessionError as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
     except Exception as e:
         return {
             'statusCode': 500,
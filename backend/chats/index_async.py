@@ -0,0 +1,232 @@
+import json
+import session
+
+# Асинхронный вариант index.handler для gateway/: asyncpg (бинарный протокол), строки читаются
+# как кортежи по позиции. Ответы совпадают с index.handler.
+
+MEMBERS_PAGE_MAX = 200
+
+
+async def handler(event: dict, context) -> dict:
+    '''API для работы с чатами: создание, получение списка, поиск пользователей, подписка на каналы (asyncpg)'''
+    method = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Db-Lsn'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    try:
+        claims = session.token_claims(event)
+        async with context.pg_pool.acquire() as conn:
+            claims = await session.authenticate_async(claims, conn)
+
+            if method == 'POST':
+                data = json.loads(event.get('body', '{}'))
+                action = data.get('action')
+
+                if action == 'create_chat':
+                    chat_type = data.get('type', 'chat')
+                    name = data.get('name', '').strip()
+                    description = data.get('description', '').strip()
+                    created_by = claims['sub']
+                    member_ids = data.get('member_ids', [])
+
+                    async with conn.transaction():
+                        chat_id = await conn.fetchval(
+                            "INSERT INTO chats (type, name, description, created_by) VALUES ($1, $2, $3, $4) RETURNING id",
+                            chat_type, name, description, created_by
+                        )
+
+                        await conn.execute(
+                            "INSERT INTO chat_members (chat_id, user_id, role) VALUES ($1, $2, $3)",
+                            chat_id, created_by, 'owner'
+                        )
+
+                        await conn.executemany(
+                            "INSERT INTO chat_members (chat_id, user_id, role) VALUES ($1, $2, $3)",
+                            [(chat_id, int(member_id), 'member') for member_id in member_ids if member_id != created_by]
+                        )
+
+                    return {
+                        'statusCode': 201,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'chat_id': chat_id}),
+                        'isBase64Encoded': False
+                    }
+
+                elif action in ('subscribe', 'unsubscribe'):
+                    chat_id = data.get('chat_id')
+
+                    if not chat_id:
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'chat_id is required'}),
+                            'isBase64Encoded': False
+                        }
+
+                    if action == 'subscribe':
+                        changed = await conn.fetchval("""
+                            INSERT INTO chat_members (chat_id, user_id, role, last_read_message_id)
+                            SELECT c.id, $1, 'member', COALESCE((SELECT MAX(id) FROM messages WHERE chat_id = c.id), 0)
+                            FROM chats c
+                            WHERE c.id = $2 AND c.type = 'channel'
+                            ON CONFLICT (chat_id, user_id) DO NOTHING
+                            RETURNING id
+                        """, claims['sub'], int(chat_id))
+                    else:
+                        changed = await conn.fetchval(
+                            "DELETE FROM chat_members WHERE chat_id = $1 AND user_id = $2 AND role = 'member' RETURNING id",
+                            int(chat_id), claims['sub']
+                        )
+
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'success': True, 'changed': changed is not None}),
+                        'isBase64Encoded': False
+                    }
+
+                elif action == 'search_users':
+                    query = data.get('query', '').strip().lower()
+
+                    if not query:
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'query is required'}),
+                            'isBase64Encoded': False
+                        }
+
+                    rows = await conn.fetch(
+                        "SELECT id, username, display_name, avatar_url FROM users WHERE LOWER(username) LIKE $1 OR LOWER(display_name) LIKE $1 LIMIT 20",
+                        f'%{query}%'
+                    )
+
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps([
+                            {'id': row[0], 'username': row[1], 'display_name': row[2], 'avatar_url': row[3]}
+                            for row in rows
+                        ]),
+                        'isBase64Encoded': False
+                    }
+
+            elif method == 'GET':
+                user_id = claims['sub']
+                path = event.get('queryStringParameters') or {}
+
+                if path.get('action') == 'members':
+                    chat_id = path.get('chat_id')
+                    after = int(path.get('after', 0))
+                    limit = min(int(path.get('limit', 50)), MEMBERS_PAGE_MAX)
+
+                    if not chat_id:
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'chat_id is required'}),
+                            'isBase64Encoded': False
+                        }
+
+                    rows = await conn.fetch("""
+                        SELECT u.id, u.username, u.display_name, u.avatar_url, cm.role
+                        FROM chat_members cm
+                        JOIN users u ON u.id = cm.user_id
+                        WHERE cm.chat_id = $1 AND cm.user_id > $2
+                          AND EXISTS (SELECT 1 FROM chat_members me WHERE me.chat_id = $1 AND me.user_id = $3)
+                        ORDER BY cm.user_id
+                        LIMIT $4
+                    """, int(chat_id), after, user_id, limit)
+                    members = [
+                        {'id': row[0], 'username': row[1], 'display_name': row[2], 'avatar_url': row[3], 'role': row[4]}
+                        for row in rows
+                    ]
+
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({
+                            'members': members,
+                            'next_after': members[-1]['id'] if len(members) == limit else None
+                        }),
+                        'isBase64Encoded': False
+                    }
+
+                rows = await conn.fetch("""
+                    SELECT
+                        c.id,
+                        c.type,
+                        c.name,
+                        c.avatar_url,
+                        (SELECT text FROM messages WHERE chat_id = c.id ORDER BY created_at DESC LIMIT 1) as last_message,
+                        (SELECT created_at FROM messages WHERE chat_id = c.id ORDER BY created_at DESC LIMIT 1) as last_message_time,
+                        CASE WHEN c.type = 'channel'
+                             THEN (SELECT COUNT(*) FROM messages m WHERE m.chat_id = c.id AND m.id > me.last_read_message_id)
+                             ELSE (SELECT COUNT(*) FROM messages m WHERE m.chat_id = c.id AND NOT ($1 = ANY(m.read_by)))
+                        END as unread_count,
+                        CASE WHEN c.type = 'channel' THEN NULL
+                             ELSE (SELECT json_agg(json_build_object('id', u.id, 'username', u.username, 'display_name', u.display_name, 'avatar_url', u.avatar_url))
+                                   FROM chat_members cm
+                                   JOIN users u ON u.id = cm.user_id
+                                   WHERE cm.chat_id = c.id AND cm.user_id != $1)
+                        END as members,
+                        (SELECT COALESCE(SUM(value), 0) FROM chat_member_counts WHERE chat_id = c.id) as member_count
+                    FROM chats c
+                    JOIN chat_members me ON me.chat_id = c.id
+                    WHERE me.user_id = $1
+                    ORDER BY last_message_time DESC NULLS LAST
+                """, user_id)
+
+                result = [
+                    {
+                        'id': row[0],
+                        'type': row[1],
+                        'name': row[2],
+                        'avatar_url': row[3],
+                        'last_message': row[4],
+                        'last_message_time': row[5].isoformat() if row[5] else row[5],
+                        'unread_count': row[6],
+                        'members': json.loads(row[7]) if row[7] else [],
+                        'member_count': row[8]
+                    }
+                    for row in rows
+                ]
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps(result),
+                    'isBase64Encoded': False
+                }
+
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    except session.SessionError as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
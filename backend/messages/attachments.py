@@ -0,0 +1,220 @@
+import base64
+import hashlib
+import os
+import re
+import uuid
+from urllib.parse import quote
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Вложения сообщений. Файлы лежат в локальной папке ATTACHMENTS_DIR (вместо объектного хранилища):
+#   blobs/ab/<sha256>        — содержимое, одно на все одинаковые файлы
+#   uploads/<upload_id>      — незавершённая загрузка по частям
+#   thumbs/<sha256>_<size>   — превью, создаётся при первом запросе
+
+ATTACHMENTS_DIR = os.environ.get('ATTACHMENTS_DIR', '/tmp/attachments')
+ATTACHMENT_MAX_SIZE = int(os.environ.get('ATTACHMENT_MAX_SIZE', str(100 * 1024 * 1024)))
+ATTACHMENT_CHUNK_MAX = int(os.environ.get('ATTACHMENT_CHUNK_MAX', str(4 * 1024 * 1024)))
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', '320'))
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Вложение доступно владельцу и участникам чата, в котором оно отправлено
+VISIBLE = """
+    (a.owner_id = %s OR EXISTS (
+        SELECT 1 FROM messages m
+        JOIN chat_members cm ON cm.chat_id = m.chat_id
+        WHERE m.id = a.message_id AND cm.user_id = %s
+    ))
+"""
+
+UPLOAD_CREATE_SQL = "INSERT INTO attachment_uploads (id, owner_id, file_name, mime_type, size) VALUES (%s, %s, %s, %s, %s)"
+UPLOAD_LOCK_SQL = "SELECT received, size, file_name, mime_type FROM attachment_uploads WHERE id = %s AND owner_id = %s FOR UPDATE"
+UPLOAD_ADVANCE_SQL = "UPDATE attachment_uploads SET received = %s WHERE id = %s"
+UPLOAD_DELETE_SQL = "DELETE FROM attachment_uploads WHERE id = %s"
+BLOB_INSERT_SQL = "INSERT INTO attachment_blobs (sha256, size) VALUES (%s, %s) ON CONFLICT (sha256) DO NOTHING"
+CREATE_SQL = "INSERT INTO attachments (sha256, owner_id, file_name, mime_type, size) VALUES (%s, %s, %s, %s, %s) RETURNING id"
+REUSE_SQL = f"""
+    INSERT INTO attachments (sha256, owner_id, file_name, mime_type, size)
+    SELECT a.sha256, %s, %s, %s, a.size FROM attachments a
+    WHERE a.sha256 = %s AND a.size = %s AND {VISIBLE}
+    LIMIT 1
+    RETURNING id
+"""
+FORWARD_SQL = f"""
+    INSERT INTO attachments (sha256, owner_id, file_name, mime_type, size)
+    SELECT a.sha256, %s, a.file_name, a.mime_type, a.size FROM attachments a
+    WHERE a.id = %s AND {VISIBLE}
+    RETURNING id
+"""
+ATTACH_SQL = "UPDATE attachments SET message_id = %s WHERE id = ANY(%s) AND owner_id = %s AND message_id IS NULL"
+PAGE_SQL = "SELECT id, message_id, file_name, mime_type, size FROM attachments WHERE message_id = ANY(%s) ORDER BY id"
+DOWNLOAD_SQL = f"SELECT a.sha256, a.file_name, a.mime_type, a.size FROM attachments a WHERE a.id = %s AND {VISIBLE}"
+
+
+class AttachmentError(Exception):
+    '''fields — дополнительные поля тела ответа с ошибкой'''
+
+    def __init__(self, message: str, status_code: int = 400, **fields):
+        super().__init__(message)
+        self.status_code = status_code
+        self.fields = fields
+
+
+def pg(sql: str) -> str:
+    '''Тот же запрос с плейсхолдерами asyncpg ($1, $2, ...)'''
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], 1))
+
+
+def new_upload(data: dict) -> tuple:
+    '''Проверяет заявку на загрузку: (id загрузки, имя файла, mime-тип, размер, sha256 или None)'''
+    file_name = os.path.basename(str(data.get('file_name', '')).strip())[:255]
+    mime_type = str(data.get('mime_type') or 'application/octet-stream')[:100]
+    size = int(data.get('size', 0))
+    sha256 = str(data.get('sha256', '')).lower() or None
+
+    if not file_name or size <= 0:
+        raise AttachmentError('file_name and size are required')
+    if size > ATTACHMENT_MAX_SIZE:
+        raise AttachmentError('File is too large', 413)
+    if sha256 and not _SHA256_RE.match(sha256):
+        raise AttachmentError('sha256 must be a hex digest')
+
+    return uuid.uuid4().hex, file_name, mime_type, size, sha256
+
+
+def chunk_body(event: dict) -> bytes:
+    body = event.get('body') or ''
+    data = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('utf-8')
+    if not data:
+        raise AttachmentError('Empty chunk')
+    if len(data) > ATTACHMENT_CHUNK_MAX:
+        raise AttachmentError('Chunk is too large', 413)
+    return data
+
+
+def check_chunk(upload, offset: int, length: int) -> int:
+    '''Части пишутся по порядку; при несовпадении offset клиент продолжает с received из ответа 409'''
+    if upload is None:
+        raise AttachmentError('Upload not found', 404)
+    received, size = upload['received'], upload['size']
+    if offset != received:
+        raise AttachmentError(f'Expected offset {received}', 409, received=received)
+    if received + length > size:
+        raise AttachmentError('Chunk exceeds declared size')
+    return received + length
+
+
+def _path(*parts) -> str:
+    return os.path.join(ATTACHMENTS_DIR, *parts)
+
+
+def blob_path(sha256: str) -> str:
+    return _path('blobs', sha256[:2], sha256)
+
+
+def write_chunk(upload_id: str, offset: int, data: bytes) -> None:
+    path = _path('uploads', upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'r+b' if offset else 'wb') as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def finish_upload(upload_id: str) -> tuple:
+    '''Считает sha256 загруженного файла и переносит его в blobs/; если такой blob уже есть, файл удаляется.
+
+    Возвращает (sha256, был ли blob уже сохранён).
+    '''
+    path = _path('uploads', upload_id)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+
+    target = blob_path(sha256)
+    if os.path.exists(target):
+        os.remove(path)
+        return sha256, True
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    return sha256, False
+
+
+def thumbnail_path(sha256: str, mime_type: str) -> str:
+    '''Превью картинки; создаётся при первом запросе и дальше отдаётся из thumbs/'''
+    if Image is None or not mime_type.startswith('image/'):
+        raise AttachmentError('Thumbnail is not available', 404)
+
+    path = _path('thumbs', f'{sha256}_{THUMBNAIL_SIZE}')
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}'
+        try:
+            with Image.open(blob_path(sha256)) as image:
+                image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                image.convert('RGB').save(tmp_path, 'JPEG', quality=80)
+        except (Image.UnidentifiedImageError, Image.DecompressionBombError, OSError):
+            # mime_type задаёт клиент: под image/* может лежать что угодно, в том числе битый или огромный файл
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise AttachmentError('Thumbnail is not available for this file', 415)
+        os.replace(tmp_path, path)
+    return path
+
+
+def download(event: dict, path: str, mime_type: str, etag: str, file_name: str = None) -> dict:
+    '''Ответ с файлом целиком или запрошенным диапазоном (Range: bytes=start-end)'''
+    headers = event.get('headers') or {}
+    common = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'Content-Range, Accept-Ranges, ETag',
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+        # Содержимое по ссылке не меняется
+        'Cache-Control': 'private, max-age=31536000, immutable'
+    }
+    if file_name:
+        common['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(file_name, safe='')}"
+
+    if (headers.get('if-none-match') or headers.get('If-None-Match')) == common['ETag']:
+        return {'statusCode': 304, 'headers': common, 'body': '', 'isBase64Encoded': False}
+
+    size = os.path.getsize(path)
+    start, end = 0, size - 1
+    status_code = 200
+
+    match = _RANGE_RE.match((headers.get('range') or headers.get('Range') or '').strip())
+    if match and (match.group(1) or match.group(2)):
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            start = max(size - int(match.group(2)), 0)
+        if start > end:
+            return {
+                'statusCode': 416,
+                'headers': {**common, 'Content-Range': f'bytes */{size}'},
+                'body': '',
+                'isBase64Encoded': False
+            }
+        status_code = 206
+        common['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start + 1)
+
+    return {
+        'statusCode': status_code,
+        'headers': {**common, 'Content-Type': mime_type, 'Content-Length': str(len(data))},
+        'body': base64.b64encode(data).decode('ascii'),
+        'isBase64Encoded': True
+    }
@@ -0,0 +1,156 @@
+import os
+import random
+import re
+import time
+import weakref
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+# Каждая функция деплоится отдельно, поэтому модуль лежит копией в каждой папке backend/*.
+# Меняйте все копии вместе.
+
+# pgcode ошибок, после которых подготовленный запрос нужно подготовить заново:
+# 26000 — запроса нет на сервере (переподключение, DISCARD ALL), 0A000 — изменилась схема
+_STALE_STATEMENT_CODES = ('26000', '0A000')
+
+REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_LSN_WAIT = float(os.environ.get('REPLICA_LSN_WAIT', '0.2'))
+
+_LSN_RE = re.compile(r'^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$')
+_REPLICA_STATE_SQL = """
+    SELECT
+        pg_last_wal_replay_lsn() >= %s::pg_lsn AS caught_up,
+        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+             ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()) END AS lag
+"""
+
+_statements = {}
+_prepared = weakref.WeakKeyDictionary()
+_replicas = weakref.WeakSet()
+
+
+def connect(context, dsn: str = None):
+    '''Соединение из общего пула шлюза (gateway/), если функция запущена в нём, иначе новое'''
+    pool = getattr(context, 'db_pool', None)
+    if pool is not None:
+        conn = pool.connect(dsn)
+        _prepared.setdefault(conn.raw, set())
+        return conn
+    return psycopg2.connect(dsn or os.environ['DATABASE_URL'])
+
+
+def connect_read(context, event: dict):
+    '''Соединение только для чтения.
+
+    Берёт реплику из DATABASE_REPLICA_URLS, если она уже применила последнюю запись клиента
+    (LSN из заголовка X-Db-Lsn, ждём до REPLICA_LSN_WAIT секунд) и отстаёт не больше
+    REPLICA_MAX_LAG секунд. Иначе — primary.
+    '''
+    if not REPLICA_URLS:
+        return connect(context)
+
+    headers = event.get('headers') or {}
+    lsn = headers.get('x-db-lsn') or headers.get('X-Db-Lsn') or ''
+    if not _LSN_RE.match(lsn):
+        lsn = '0/0'
+
+    for dsn in random.sample(REPLICA_URLS, len(REPLICA_URLS)):
+        try:
+            conn = connect(context, dsn)
+        except psycopg2.OperationalError:
+            continue
+        if _replica_ready(conn, lsn):
+            _replicas.add(conn)
+            return conn
+        conn.close()
+
+    return connect(context)
+
+
+def primary(context, conn):
+    '''conn, если оно уже на primary, иначе новое соединение с primary (для записи посреди чтения)'''
+    return connect(context) if conn in _replicas else conn
+
+
+def _replica_ready(conn, lsn: str) -> bool:
+    deadline = time.monotonic() + REPLICA_LSN_WAIT
+    cur = conn.cursor()
+    while True:
+        try:
+            cur.execute(_REPLICA_STATE_SQL, (lsn,))
+            caught_up, lag = cur.fetchone()
+        except psycopg2.Error:
+            return False
+        finally:
+            conn.rollback()
+
+        if lag is not None and lag > REPLICA_MAX_LAG:
+            return False
+        if caught_up:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+
+
+def commit(conn) -> dict:
+    '''Коммитит; при настроенных репликах возвращает заголовки с LSN записи для read-your-writes'''
+    conn.commit()
+    if not REPLICA_URLS:
+        return {}
+
+    cur = conn.cursor()
+    cur.execute('SELECT pg_current_wal_lsn()::text')
+    lsn = cur.fetchone()[0]
+    conn.rollback()
+    return {'X-Db-Lsn': lsn, 'Access-Control-Expose-Headers': 'X-Db-Lsn'}
+
+
+def statement(name: str, sql: str) -> None:
+    '''Регистрирует горячий запрос с параметрами %s под именем name'''
+    counter = iter(range(1, sql.count('%s') + 1))
+    _statements[name] = (sql, re.sub(r'%s', lambda _: f'${next(counter)}', sql))
+
+
+def execute(cur, name: str, params: tuple) -> None:
+    '''Выполняет зарегистрированный запрос.
+
+    На соединениях из пула запрос готовится (PREPARE) один раз и дальше идёт через EXECUTE;
+    на одноразовых соединениях подготовка не окупается, и запрос выполняется как обычно.
+    Если сервер потерял подготовленный запрос, он готовится заново; посреди транзакции
+    для этого EXECUTE идёт под SAVEPOINT, чтобы откатить только его.
+    '''
+    sql, prepared_sql = _statements[name]
+    conn = cur.connection
+    prepared = _prepared.get(conn)
+
+    if prepared is None:
+        cur.execute(sql, params)
+        return
+
+    in_transaction = conn.info.transaction_status != TRANSACTION_STATUS_IDLE
+    try:
+        _execute_prepared(cur, prepared, name, prepared_sql, params, 'SAVEPOINT db_execute; ' if in_transaction else '')
+    except psycopg2.Error as e:
+        if e.pgcode not in _STALE_STATEMENT_CODES:
+            raise
+        prepared.clear()
+        if in_transaction:
+            cur.execute('ROLLBACK TO SAVEPOINT db_execute')
+        else:
+            conn.rollback()
+        cur.execute('DEALLOCATE ALL')
+        _execute_prepared(cur, prepared, name, prepared_sql, params)
+
+
+def _execute_prepared(cur, prepared: set, name: str, prepared_sql: str, params: tuple, savepoint: str = '') -> None:
+    # savepoint отправляется одним запросом с PREPARE/EXECUTE, без лишнего обращения к серверу;
+    # точки сохранения снимаются вместе с транзакцией
+    if name not in prepared:
+        cur.execute(f'{savepoint}PREPARE {name} AS {prepared_sql}')
+        prepared.add(name)
+        savepoint = ''
+    placeholders = ', '.join(['%s'] * len(params))
+    cur.execute(f'{savepoint}EXECUTE {name} ({placeholders})' if params else f'{savepoint}EXECUTE {name}', params)
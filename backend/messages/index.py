@@ -1,11 +1,59 @@
 import json
-import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
+import attachments
+import db
+import profiles
+import session
 from datetime import datetime
 
+db.statement('messages_insert', "INSERT INTO messages (chat_id, sender_id, text, read_by) VALUES (%s, %s, %s, ARRAY[%s::integer]) RETURNING id, created_at")
+db.statement('messages_page', """
+    SELECT
+        m.id,
+        m.text,
+        m.sender_id,
+        m.created_at,
+        m.read_by
+    FROM messages m
+    WHERE m.chat_id = %s
+    ORDER BY m.created_at DESC
+    LIMIT %s
+""")
+db.statement('messages_mark_read', "UPDATE messages SET read_by = array_append(read_by, %s) WHERE chat_id = %s AND NOT (%s = ANY(read_by))")
+# Свой пост в канале сразу прочитан: отметка автора сдвигается в том же запросе
+db.statement('channel_insert', """
+    WITH posted AS (
+        INSERT INTO messages (chat_id, sender_id, text, read_by)
+        SELECT %s, %s, %s, ARRAY[%s::integer]
+        WHERE EXISTS (SELECT 1 FROM chat_members WHERE chat_id = %s AND user_id = %s AND role IN ('owner', 'admin'))
+        RETURNING id, created_at
+    ), seen AS (
+        UPDATE chat_members cm SET last_read_message_id = posted.id
+        FROM posted
+        WHERE cm.chat_id = %s AND cm.user_id = %s AND cm.last_read_message_id < posted.id
+    )
+    SELECT id, created_at FROM posted
+""")
+db.statement('channel_watermark', "SELECT last_read_message_id FROM chat_members WHERE chat_id = %s AND user_id = %s")
+db.statement('channel_mark_read', "UPDATE chat_members SET last_read_message_id = %s WHERE chat_id = %s AND user_id = %s AND last_read_message_id < %s")
+
+# Тип чата не меняется, поэтому кэшируем его на всё время жизни процесса
+_chat_types = {}
+
+
+def _chat_type(cur, chat_id) -> str:
+    chat_id = int(chat_id)
+    if chat_id not in _chat_types:
+        cur.execute("SELECT type FROM chats WHERE id = %s", (chat_id,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        _chat_types[chat_id] = row['type']
+    return _chat_types[chat_id]
+
+
 def handler(event: dict, context) -> dict:
-    '''API для отправки и получения сообщений в реальном времени'''
+    '''API для отправки и получения сообщений в реальном времени, вложения к сообщениям'''
     method = event.get('httpMethod', 'GET')
     path = event.get('queryStringParameters') or {}
     
@@ -15,41 +63,171 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Db-Lsn, Range, If-None-Match'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        claims = session.token_claims(event)
+        conn = db.connect_read(context, event) if method == 'GET' else db.connect(context)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
+        claims = session.authenticate(claims, cur)
+        
+        if method == 'POST' and path.get('action') == 'upload_chunk':
+            # Тело запроса — сами байты части, upload_id и offset в query
+            upload_id = path.get('upload_id', '')
+            offset = int(path.get('offset', 0))
+            chunk = attachments.chunk_body(event)
+            
+            cur.execute(attachments.UPLOAD_LOCK_SQL, (upload_id, claims['sub']))
+            received = attachments.check_chunk(cur.fetchone(), offset, len(chunk))
+            attachments.write_chunk(upload_id, offset, chunk)
+            cur.execute(attachments.UPLOAD_ADVANCE_SQL, (received, upload_id))
+            conn.commit()
+            conn.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'received': received}),
+                'isBase64Encoded': False
+            }
+        
         if method == 'POST':
             data = json.loads(event.get('body', '{}'))
+            action = data.get('action')
+            
+            if action == 'upload_start':
+                upload_id, file_name, mime_type, size, sha256 = attachments.new_upload(data)
+                
+                # Файл с тем же sha256, который пользователь уже видит, не загружаем повторно
+                if sha256:
+                    cur.execute(attachments.REUSE_SQL, (claims['sub'], file_name, mime_type, sha256, size, claims['sub'], claims['sub']))
+                    reused = cur.fetchone()
+                    if reused:
+                        lsn_headers = db.commit(conn)
+                        conn.close()
+                        return {
+                            'statusCode': 201,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
+                            'body': json.dumps({'attachment_id': reused['id'], 'deduplicated': True}),
+                            'isBase64Encoded': False
+                        }
+                
+                cur.execute(attachments.UPLOAD_CREATE_SQL, (upload_id, claims['sub'], file_name, mime_type, size))
+                conn.commit()
+                conn.close()
+                
+                return {
+                    'statusCode': 201,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'upload_id': upload_id, 'chunk_size': attachments.ATTACHMENT_CHUNK_MAX}),
+                    'isBase64Encoded': False
+                }
+            
+            if action == 'upload_complete':
+                upload_id = str(data.get('upload_id', ''))
+                
+                cur.execute(attachments.UPLOAD_LOCK_SQL, (upload_id, claims['sub']))
+                upload = cur.fetchone()
+                
+                if not upload or upload['received'] != upload['size']:
+                    conn.close()
+                    return {
+                        'statusCode': 409 if upload else 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Upload is not complete' if upload else 'Upload not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                sha256, deduplicated = attachments.finish_upload(upload_id)
+                cur.execute(attachments.BLOB_INSERT_SQL, (sha256, upload['size']))
+                cur.execute(attachments.CREATE_SQL, (sha256, claims['sub'], upload['file_name'], upload['mime_type'], upload['size']))
+                attachment_id = cur.fetchone()['id']
+                cur.execute(attachments.UPLOAD_DELETE_SQL, (upload_id,))
+                lsn_headers = db.commit(conn)
+                conn.close()
+                
+                return {
+                    'statusCode': 201,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
+                    'body': json.dumps({'attachment_id': attachment_id, 'deduplicated': deduplicated}),
+                    'isBase64Encoded': False
+                }
+            
+            if action == 'forward_attachment':
+                cur.execute(attachments.FORWARD_SQL, (claims['sub'], data.get('attachment_id'), claims['sub'], claims['sub']))
+                forwarded = cur.fetchone()
+                
+                if not forwarded:
+                    conn.close()
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Attachment not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                lsn_headers = db.commit(conn)
+                conn.close()
+                
+                return {
+                    'statusCode': 201,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
+                    'body': json.dumps({'attachment_id': forwarded['id']}),
+                    'isBase64Encoded': False
+                }
+            
             chat_id = data.get('chat_id')
-            sender_id = data.get('sender_id')
+            sender_id = claims['sub']
             text = data.get('text', '').strip()
+            attachment_ids = [int(attachment_id) for attachment_id in data.get('attachment_ids') or []]
             
-            if not chat_id or not sender_id or not text:
+            if not chat_id or not (text or attachment_ids):
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'chat_id, sender_id and text are required'}),
+                    'body': json.dumps({'error': 'chat_id and text are required'}),
                     'isBase64Encoded': False
                 }
             
-            cur.execute(
-                "INSERT INTO messages (chat_id, sender_id, text, read_by) VALUES (%s, %s, %s, ARRAY[%s]) RETURNING id, created_at",
-                (chat_id, sender_id, text, sender_id)
-            )
+            # В канал пишут только владелец и администраторы
+            if _chat_type(cur, chat_id) == 'channel':
+                db.execute(cur, 'channel_insert', (chat_id, sender_id, text, sender_id, chat_id, sender_id, chat_id, sender_id))
+            else:
+                db.execute(cur, 'messages_insert', (chat_id, sender_id, text, sender_id))
             result = cur.fetchone()
-            conn.commit()
+            
+            if not result:
+                conn.close()
+                return {
+                    'statusCode': 403,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Only channel admins can post'}),
+                    'isBase64Encoded': False
+                }
+            
+            if attachment_ids:
+                cur.execute(attachments.ATTACH_SQL, (result['id'], attachment_ids, sender_id))
+                if cur.rowcount != len(set(attachment_ids)):
+                    conn.rollback()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Unknown or already sent attachment'}),
+                        'isBase64Encoded': False
+                    }
+            
+            lsn_headers = db.commit(conn)
             conn.close()
             
             return {
                 'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                 'body': json.dumps({
                     'message_id': result['id'],
                     'created_at': result['created_at'].isoformat()
@@ -57,10 +235,32 @@ def handler(event: dict, context) -> dict:
                 'isBase64Encoded': False
             }
         
+        elif method == 'GET' and path.get('action') == 'attachment':
+            cur.execute(attachments.DOWNLOAD_SQL, (path.get('id'), claims['sub'], claims['sub']))
+            attachment = cur.fetchone()
+            conn.close()
+            
+            if not attachment:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Attachment not found'}),
+                    'isBase64Encoded': False
+                }
+            
+            if path.get('thumb'):
+                thumb = attachments.thumbnail_path(attachment['sha256'], attachment['mime_type'])
+                return attachments.download(event, thumb, 'image/jpeg', f"{attachment['sha256']}-{attachments.THUMBNAIL_SIZE}")
+            
+            return attachments.download(
+                event, attachments.blob_path(attachment['sha256']), attachment['mime_type'], attachment['sha256'], attachment['file_name']
+            )
+        
         elif method == 'GET':
             chat_id = path.get('chat_id')
-            user_id = path.get('user_id')
+            user_id = claims['sub']
             limit = int(path.get('limit', 100))
+            compact = path.get('view') == 'compact'
             
             if not chat_id:
                 return {
@@ -70,31 +270,37 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            cur.execute("""
-                SELECT 
-                    m.id,
-                    m.text,
-                    m.sender_id,
-                    m.created_at,
-                    m.read_by,
-                    u.username,
-                    u.display_name,
-                    u.avatar_url
-                FROM messages m
-                JOIN users u ON u.id = m.sender_id
-                WHERE m.chat_id = %s
-                ORDER BY m.created_at DESC
-                LIMIT %s
-            """, (chat_id, limit))
+            db.execute(cur, 'messages_page', (chat_id, limit))
             
             messages = cur.fetchall()
+            senders = profiles.load(cur, [msg['sender_id'] for msg in messages])
             
-            if user_id:
-                cur.execute(
-                    "UPDATE messages SET read_by = array_append(read_by, %s) WHERE chat_id = %s AND NOT (%s = ANY(read_by))",
-                    (user_id, chat_id, user_id)
-                )
-                conn.commit()
+            files = {}
+            if messages:
+                cur.execute(attachments.PAGE_SQL, ([msg['id'] for msg in messages],))
+                for attachment in cur.fetchall():
+                    files.setdefault(attachment.pop('message_id'), []).append(dict(attachment))
+            
+            lsn_headers = {}
+            
+            # Отмечаем прочтение только если на странице есть непрочитанные — обычный опрос ничего не пишет в primary.
+            # В каналах вместо read_by двигаем отметку подписчика, чтобы стоимость не зависела от числа подписчиков.
+            if _chat_type(cur, chat_id) == 'channel':
+                newest = max((msg['id'] for msg in messages), default=0)
+                db.execute(cur, 'channel_watermark', (chat_id, user_id))
+                watermark = cur.fetchone()
+                has_unread = watermark is not None and newest > watermark['last_read_message_id']
+                mark_read = ('channel_mark_read', (newest, chat_id, user_id, newest))
+            else:
+                has_unread = any(user_id not in (msg['read_by'] or []) for msg in messages)
+                mark_read = ('messages_mark_read', (user_id, chat_id, user_id))
+            
+            if has_unread:
+                writer = db.primary(context, conn)
+                db.execute(writer.cursor(), *mark_read)
+                lsn_headers = db.commit(writer)
+                if writer is not conn:
+                    writer.close()
             
             conn.close()
             
@@ -103,13 +309,20 @@ def handler(event: dict, context) -> dict:
                 msg_dict = dict(msg)
                 msg_dict['created_at'] = msg_dict['created_at'].isoformat()
                 msg_dict['read_by'] = list(msg_dict['read_by']) if msg_dict['read_by'] else []
+                msg_dict['attachments'] = files.get(msg_dict['id'], [])
+                if not compact:
+                    msg_dict.update(senders.get(msg_dict['sender_id'], profiles.UNKNOWN))
                 result.append(msg_dict)
             
             result.reverse()
             
+            # view=compact: профили отправителей один раз в senders, а не в каждом сообщении
+            if compact:
+                result = {'messages': result, 'senders': senders}
+            
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                 'body': json.dumps(result),
                 'isBase64Encoded': False
             }
@@ -121,6 +334,13 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
         
+    except (session.SessionError, attachments.AttachmentError) as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e), **getattr(e, 'fields', {})}),
+            'isBase64Encoded': False
+        }
     except Exception as e:
         return {
             'statusCode': 500,
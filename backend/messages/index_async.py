@@ -0,0 +1,323 @@
+import asyncio
+import json
+import attachments
+import profiles
+import session
+
+# Асинхронный вариант index.handler для gateway/: asyncpg (бинарный протокол), строки читаются
+# как кортежи по позиции. Ответы совпадают с index.handler.
+
+# Тип чата не меняется, поэтому кэшируем его на всё время жизни процесса
+_chat_types = {}
+
+
+async def _chat_type(conn, chat_id: int) -> str:
+    if chat_id not in _chat_types:
+        chat_type = await conn.fetchval("SELECT type FROM chats WHERE id = $1", chat_id)
+        if chat_type is None:
+            return None
+        _chat_types[chat_id] = chat_type
+    return _chat_types[chat_id]
+
+
+async def handler(event: dict, context) -> dict:
+    '''API для отправки и получения сообщений в реальном времени, вложения к сообщениям (asyncpg)'''
+    method = event.get('httpMethod', 'GET')
+    path = event.get('queryStringParameters') or {}
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Db-Lsn, Range, If-None-Match'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    try:
+        claims = session.token_claims(event)
+        async with context.pg_pool.acquire() as conn:
+            claims = await session.authenticate_async(claims, conn)
+
+            if method == 'POST' and path.get('action') == 'upload_chunk':
+                upload_id = path.get('upload_id', '')
+                offset = int(path.get('offset', 0))
+                chunk = attachments.chunk_body(event)
+
+                async with conn.transaction():
+                    upload = await conn.fetchrow(attachments.pg(attachments.UPLOAD_LOCK_SQL), upload_id, claims['sub'])
+                    received = attachments.check_chunk(upload, offset, len(chunk))
+                    await asyncio.to_thread(attachments.write_chunk, upload_id, offset, chunk)
+                    await conn.execute(attachments.pg(attachments.UPLOAD_ADVANCE_SQL), received, upload_id)
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'received': received}),
+                    'isBase64Encoded': False
+                }
+
+            if method == 'POST':
+                data = json.loads(event.get('body', '{}'))
+                action = data.get('action')
+
+                if action == 'upload_start':
+                    upload_id, file_name, mime_type, size, sha256 = attachments.new_upload(data)
+
+                    if sha256:
+                        reused = await conn.fetchval(
+                            attachments.pg(attachments.REUSE_SQL),
+                            claims['sub'], file_name, mime_type, sha256, size, claims['sub'], claims['sub']
+                        )
+                        if reused:
+                            return {
+                                'statusCode': 201,
+                                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                                'body': json.dumps({'attachment_id': reused, 'deduplicated': True}),
+                                'isBase64Encoded': False
+                            }
+
+                    await conn.execute(attachments.pg(attachments.UPLOAD_CREATE_SQL), upload_id, claims['sub'], file_name, mime_type, size)
+
+                    return {
+                        'statusCode': 201,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'upload_id': upload_id, 'chunk_size': attachments.ATTACHMENT_CHUNK_MAX}),
+                        'isBase64Encoded': False
+                    }
+
+                if action == 'upload_complete':
+                    upload_id = str(data.get('upload_id', ''))
+
+                    async with conn.transaction():
+                        upload = await conn.fetchrow(attachments.pg(attachments.UPLOAD_LOCK_SQL), upload_id, claims['sub'])
+
+                        if not upload or upload['received'] != upload['size']:
+                            return {
+                                'statusCode': 409 if upload else 404,
+                                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                                'body': json.dumps({'error': 'Upload is not complete' if upload else 'Upload not found'}),
+                                'isBase64Encoded': False
+                            }
+
+                        sha256, deduplicated = await asyncio.to_thread(attachments.finish_upload, upload_id)
+                        await conn.execute(attachments.pg(attachments.BLOB_INSERT_SQL), sha256, upload['size'])
+                        attachment_id = await conn.fetchval(
+                            attachments.pg(attachments.CREATE_SQL),
+                            sha256, claims['sub'], upload['file_name'], upload['mime_type'], upload['size']
+                        )
+                        await conn.execute(attachments.pg(attachments.UPLOAD_DELETE_SQL), upload_id)
+
+                    return {
+                        'statusCode': 201,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'attachment_id': attachment_id, 'deduplicated': deduplicated}),
+                        'isBase64Encoded': False
+                    }
+
+                if action == 'forward_attachment':
+                    forwarded = await conn.fetchval(
+                        attachments.pg(attachments.FORWARD_SQL),
+                        claims['sub'], int(data.get('attachment_id') or 0), claims['sub'], claims['sub']
+                    )
+
+                    if not forwarded:
+                        return {
+                            'statusCode': 404,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'Attachment not found'}),
+                            'isBase64Encoded': False
+                        }
+
+                    return {
+                        'statusCode': 201,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'attachment_id': forwarded}),
+                        'isBase64Encoded': False
+                    }
+
+                chat_id = data.get('chat_id')
+                sender_id = claims['sub']
+                text = data.get('text', '').strip()
+                attachment_ids = [int(attachment_id) for attachment_id in data.get('attachment_ids') or []]
+
+                if not chat_id or not (text or attachment_ids):
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'chat_id and text are required'}),
+                        'isBase64Encoded': False
+                    }
+
+                async with conn.transaction():
+                    if await _chat_type(conn, int(chat_id)) == 'channel':
+                        # Свой пост в канале сразу прочитан: отметка автора сдвигается в том же запросе
+                        row = await conn.fetchrow("""
+                            WITH posted AS (
+                                INSERT INTO messages (chat_id, sender_id, text, read_by)
+                                SELECT $1, $2, $3, ARRAY[$2::integer]
+                                WHERE EXISTS (SELECT 1 FROM chat_members WHERE chat_id = $1 AND user_id = $2 AND role IN ('owner', 'admin'))
+                                RETURNING id, created_at
+                            ), seen AS (
+                                UPDATE chat_members cm SET last_read_message_id = posted.id
+                                FROM posted
+                                WHERE cm.chat_id = $1 AND cm.user_id = $2 AND cm.last_read_message_id < posted.id
+                            )
+                            SELECT id, created_at FROM posted
+                        """, int(chat_id), sender_id, text)
+                    else:
+                        row = await conn.fetchrow(
+                            "INSERT INTO messages (chat_id, sender_id, text, read_by) VALUES ($1, $2, $3, ARRAY[$2::integer]) RETURNING id, created_at",
+                            int(chat_id), sender_id, text
+                        )
+
+                    if row is not None and attachment_ids:
+                        attached = await conn.execute(attachments.pg(attachments.ATTACH_SQL), row[0], attachment_ids, sender_id)
+                        if int(attached.split()[-1]) != len(set(attachment_ids)):
+                            raise attachments.AttachmentError('Unknown or already sent attachment')
+
+                if row is None:
+                    return {
+                        'statusCode': 403,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Only channel admins can post'}),
+                        'isBase64Encoded': False
+                    }
+
+                message_id, created_at = row
+
+                return {
+                    'statusCode': 201,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'message_id': message_id,
+                        'created_at': created_at.isoformat()
+                    }),
+                    'isBase64Encoded': False
+                }
+
+            elif method == 'GET' and path.get('action') == 'attachment':
+                attachment = await conn.fetchrow(
+                    attachments.pg(attachments.DOWNLOAD_SQL), int(path.get('id') or 0), claims['sub'], claims['sub']
+                )
+
+                if not attachment:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Attachment not found'}),
+                        'isBase64Encoded': False
+                    }
+
+                if path.get('thumb'):
+                    thumb = await asyncio.to_thread(attachments.thumbnail_path, attachment['sha256'], attachment['mime_type'])
+                    return await asyncio.to_thread(
+                        attachments.download, event, thumb, 'image/jpeg', f"{attachment['sha256']}-{attachments.THUMBNAIL_SIZE}"
+                    )
+
+                return await asyncio.to_thread(
+                    attachments.download,
+                    event, attachments.blob_path(attachment['sha256']), attachment['mime_type'], attachment['sha256'], attachment['file_name']
+                )
+
+            elif method == 'GET':
+                chat_id = path.get('chat_id')
+                user_id = claims['sub']
+                limit = int(path.get('limit', 100))
+                compact = path.get('view') == 'compact'
+
+                if not chat_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'chat_id is required'}),
+                        'isBase64Encoded': False
+                    }
+
+                rows = await conn.fetch("""
+                    SELECT
+                        m.id,
+                        m.text,
+                        m.sender_id,
+                        m.created_at,
+                        m.read_by
+                    FROM messages m
+                    WHERE m.chat_id = $1
+                    ORDER BY m.created_at DESC
+                    LIMIT $2
+                """, int(chat_id), limit)
+                senders = await profiles.load_async(conn, [row[2] for row in rows])
+
+                files = {}
+                if rows:
+                    for attachment in await conn.fetch(attachments.pg(attachments.PAGE_SQL), [row[0] for row in rows]):
+                        files.setdefault(attachment[1], []).append({
+                            'id': attachment[0], 'file_name': attachment[2], 'mime_type': attachment[3], 'size': attachment[4]
+                        })
+
+                # Как и в index.handler: пишем прочтение только если на странице есть непрочитанные
+                if await _chat_type(conn, int(chat_id)) == 'channel':
+                    newest = max((row[0] for row in rows), default=0)
+                    watermark = await conn.fetchval(
+                        "SELECT last_read_message_id FROM chat_members WHERE chat_id = $1 AND user_id = $2",
+                        int(chat_id), user_id
+                    )
+                    if watermark is not None and newest > watermark:
+                        await conn.execute(
+                            "UPDATE chat_members SET last_read_message_id = $1 WHERE chat_id = $2 AND user_id = $3 AND last_read_message_id < $1",
+                            newest, int(chat_id), user_id
+                        )
+                elif any(user_id not in (row[4] or []) for row in rows):
+                    await conn.execute(
+                        "UPDATE messages SET read_by = array_append(read_by, $1) WHERE chat_id = $2 AND NOT ($1 = ANY(read_by))",
+                        user_id, int(chat_id)
+                    )
+
+                result = []
+                for row in reversed(rows):
+                    msg_dict = {
+                        'id': row[0],
+                        'text': row[1],
+                        'sender_id': row[2],
+                        'created_at': row[3].isoformat(),
+                        'read_by': list(row[4]) if row[4] else [],
+                        'attachments': files.get(row[0], [])
+                    }
+                    if not compact:
+                        msg_dict.update(senders.get(row[2], profiles.UNKNOWN))
+                    result.append(msg_dict)
+
+                if compact:
+                    result = {'messages': result, 'senders': senders}
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps(result),
+                    'isBase64Encoded': False
+                }
+
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    except (session.SessionError, attachments.AttachmentError) as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e), **getattr(e, 'fields', {})}),
+            'isBase64Encoded': False
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
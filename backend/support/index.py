@@ -1,10 +1,14 @@
 import json
 import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
+import db
+import profiles
+import session
+
+SUPPORT_LEASE_SECONDS = int(os.environ.get('SUPPORT_LEASE_SECONDS', '600'))
 
 def handler(event: dict, context) -> dict:
-    '''API для чата поддержки: создание тикетов, отправка и получение сообщений'''
+    '''API для чата поддержки: создание тикетов, отправка и получение сообщений, очередь тикетов для агентов'''
     method = event.get('httpMethod', 'GET')
     query_params = event.get('queryStringParameters') or {}
     
@@ -14,30 +18,34 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id'
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Db-Lsn'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        claims = session.token_claims(event)
+        conn = db.connect_read(context, event) if method == 'GET' else db.connect(context)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
+        claims = session.authenticate(claims, cur)
+        is_admin = claims['adm']
+        
         if method == 'POST':
             data = json.loads(event.get('body', '{}'))
             action = data.get('action')
             
             if action == 'create_ticket':
-                user_id = data.get('user_id')
+                user_id = claims['sub']
                 subject = data.get('subject', '').strip()
                 message = data.get('message', '').strip()
                 
-                if not user_id or not subject or not message:
+                if not subject or not message:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'user_id, subject and message are required'}),
+                        'body': json.dumps({'error': 'subject and message are required'}),
                         'isBase64Encoded': False
                     }
                 
@@ -53,12 +61,12 @@ def handler(event: dict, context) -> dict:
                     (ticket_id, user_id, message, False)
                 )
                 
-                conn.commit()
+                lsn_headers = db.commit(conn)
                 conn.close()
                 
                 return {
                     'statusCode': 201,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                     'body': json.dumps({
                         'ticket_id': ticket_id,
                         'created_at': ticket['created_at'].isoformat()
@@ -68,35 +76,54 @@ def handler(event: dict, context) -> dict:
             
             elif action == 'send_message':
                 ticket_id = data.get('ticket_id')
-                sender_id = data.get('sender_id')
+                sender_id = claims['sub']
                 message = data.get('message', '').strip()
-                is_admin_reply = data.get('is_admin_reply', False)
+                is_admin_reply = is_admin and data.get('is_admin_reply', False)
                 
-                if not ticket_id or not sender_id or not message:
+                if not ticket_id or not message:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'ticket_id, sender_id and message are required'}),
+                        'body': json.dumps({'error': 'ticket_id and message are required'}),
                         'isBase64Encoded': False
                     }
                 
                 cur.execute(
-                    "INSERT INTO support_messages (ticket_id, sender_id, message, is_admin_reply) VALUES (%s, %s, %s, %s) RETURNING id, created_at",
-                    (ticket_id, sender_id, message, is_admin_reply)
+                    """
+                    INSERT INTO support_messages (ticket_id, sender_id, message, is_admin_reply)
+                    SELECT id, %s, %s, %s FROM support_tickets WHERE id = %s AND (user_id = %s OR %s)
+                    RETURNING id, created_at
+                    """,
+                    (sender_id, message, is_admin_reply, ticket_id, sender_id, is_admin)
                 )
                 result = cur.fetchone()
                 
+                if not result:
+                    conn.close()
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Ticket not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                # Ответ назначенного агента продлевает аренду тикета
                 cur.execute(
-                    "UPDATE support_tickets SET updated_at = NOW() WHERE id = %s",
-                    (ticket_id,)
+                    """
+                    UPDATE support_tickets
+                    SET updated_at = NOW(),
+                        lease_expires_at = CASE WHEN assigned_to = %s THEN NOW() + make_interval(secs => %s) ELSE lease_expires_at END
+                    WHERE id = %s
+                    """,
+                    (sender_id, SUPPORT_LEASE_SECONDS, ticket_id)
                 )
                 
-                conn.commit()
+                lsn_headers = db.commit(conn)
                 conn.close()
                 
                 return {
                     'statusCode': 201,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                     'body': json.dumps({
                         'message_id': result['id'],
                         'created_at': result['created_at'].isoformat()
@@ -116,15 +143,77 @@ def handler(event: dict, context) -> dict:
                     }
                 
                 cur.execute(
-                    "UPDATE support_tickets SET status = %s, updated_at = NOW() WHERE id = %s",
-                    ('closed', ticket_id)
+                    "UPDATE support_tickets SET status = %s, assigned_to = NULL, lease_expires_at = NULL, updated_at = NOW() WHERE id = %s AND (user_id = %s OR %s)",
+                    ('closed', ticket_id, claims['sub'], is_admin)
                 )
-                conn.commit()
+                lsn_headers = db.commit(conn)
                 conn.close()
                 
                 return {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
+                    'body': json.dumps({'success': True}),
+                    'isBase64Encoded': False
+                }
+        
+            elif action == 'claim_ticket':
+                session.require_admin(claims)
+                
+                # Следующий свободный тикет (или с истёкшей арендой); занятые другими агентами строки пропускаем, а не ждём
+                cur.execute(
+                    """
+                    UPDATE support_tickets
+                    SET assigned_to = %s, lease_expires_at = NOW() + make_interval(secs => %s)
+                    WHERE id = (
+                        SELECT id FROM support_tickets
+                        WHERE status = 'open' AND (assigned_to IS NULL OR lease_expires_at < NOW())
+                        ORDER BY created_at
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, subject, status, created_at, updated_at, user_id, lease_expires_at
+                    """,
+                    (claims['sub'], SUPPORT_LEASE_SECONDS)
+                )
+                ticket = cur.fetchone()
+                lsn_headers = db.commit(conn)
+                
+                if ticket:
+                    ticket = dict(ticket)
+                    ticket.update(profiles.load(cur, [ticket['user_id']]).get(ticket['user_id'], profiles.UNKNOWN))
+                    for key in ('created_at', 'updated_at', 'lease_expires_at'):
+                        ticket[key] = ticket[key].isoformat()
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
+                    'body': json.dumps({'ticket': ticket}),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'release_ticket':
+                session.require_admin(claims)
+                ticket_id = data.get('ticket_id')
+                
+                if not ticket_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'ticket_id is required'}),
+                        'isBase64Encoded': False
+                    }
+                
+                cur.execute(
+                    "UPDATE support_tickets SET assigned_to = NULL, lease_expires_at = NULL WHERE id = %s AND assigned_to = %s",
+                    (ticket_id, claims['sub'])
+                )
+                lsn_headers = db.commit(conn)
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **lsn_headers},
                     'body': json.dumps({'success': True}),
                     'isBase64Encoded': False
                 }
@@ -133,7 +222,11 @@ def handler(event: dict, context) -> dict:
             action = query_params.get('action')
             
             if action == 'tickets':
-                user_id = query_params.get('user_id')
+                # Страница поддержки просит свои тикеты (mine=1) и у админа; без него админ видит общий список
+                if is_admin and query_params.get('mine') != '1':
+                    user_id = query_params.get('user_id')
+                else:
+                    user_id = claims['sub']
                 status = query_params.get('status')
                 
                 if user_id:
@@ -191,6 +284,7 @@ def handler(event: dict, context) -> dict:
             
             elif action == 'messages':
                 ticket_id = query_params.get('ticket_id')
+                compact = query_params.get('view') == 'compact'
                 
                 if not ticket_id:
                     return {
@@ -201,15 +295,15 @@ def handler(event: dict, context) -> dict:
                     }
                 
                 cur.execute("""
-                    SELECT sm.id, sm.message, sm.is_admin_reply, sm.created_at,
-                           u.username, u.display_name, u.avatar_url
+                    SELECT sm.id, sm.message, sm.is_admin_reply, sm.created_at, sm.sender_id
                     FROM support_messages sm
-                    JOIN users u ON u.id = sm.sender_id
-                    WHERE sm.ticket_id = %s
+                    JOIN support_tickets st ON st.id = sm.ticket_id
+                    WHERE sm.ticket_id = %s AND (st.user_id = %s OR %s)
                     ORDER BY sm.created_at ASC
-                """, (ticket_id,))
+                """, (ticket_id, claims['sub'], is_admin))
                 
                 messages = cur.fetchall()
+                senders = profiles.load(cur, [msg['sender_id'] for msg in messages])
                 conn.close()
                 
                 result = []
@@ -217,8 +311,15 @@ def handler(event: dict, context) -> dict:
                     msg_dict = dict(msg)
                     if msg_dict.get('created_at'):
                         msg_dict['created_at'] = msg_dict['created_at'].isoformat()
+                    if not compact:
+                        sender_id = msg_dict.pop('sender_id')
+                        msg_dict.update(senders.get(sender_id, profiles.UNKNOWN))
                     result.append(msg_dict)
                 
+                # view=compact: профили отправителей один раз в senders, а не в каждом сообщении
+                if compact:
+                    result = {'messages': result, 'senders': senders}
+                
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -233,6 +334,13 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
         
+    except session.SessionError as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
     except Exception as e:
         return {
             'statusCode': 500,
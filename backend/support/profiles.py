@@ -0,0 +1,109 @@
+import os
+import time
+
+# Каждая функция деплоится отдельно, поэтому модуль лежит копией в каждой папке backend/*, где он нужен.
+# Меняйте все копии вместе.
+
+PROFILE_CACHE_REFRESH = float(os.environ.get('PROFILE_CACHE_REFRESH', '5'))
+PROFILE_CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL', '300'))
+PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', '10000'))
+PROFILE_VERSION_OVERLAP = int(os.environ.get('PROFILE_VERSION_OVERLAP', '64'))
+
+# Версия берётся из закоммиченных строк, а не из last_value последовательности: nextval виден до коммита
+# строки, а на реплике last_value забегает вперёд. Изменения перечитываются с запасом PROFILE_VERSION_OVERLAP,
+# чтобы не пропустить строку, закоммиченную позже строки с большей версией.
+LATEST_VERSION_SQL = "SELECT COALESCE(MAX(profile_version), 0) FROM users"
+CHANGED_SQL = "SELECT id, username, display_name, avatar_url, profile_version FROM users WHERE profile_version > %s"
+BY_ID_SQL = "SELECT id, username, display_name, avatar_url FROM users WHERE id = ANY(%s)"
+
+UNKNOWN = {'username': None, 'display_name': None, 'avatar_url': None}
+
+# user_id -> (момент загрузки, профиль)
+_cache = {}
+_version = None
+_checked_at = None
+
+
+def _store(rows) -> None:
+    if len(_cache) > PROFILE_CACHE_SIZE:
+        _cache.clear()
+    now = time.monotonic()
+    for row in rows:
+        _cache[row[0]] = (now, {'username': row[1], 'display_name': row[2], 'avatar_url': row[3]})
+
+
+def _refresh(rows) -> int:
+    '''Кладёт изменившиеся профили в кэш и возвращает новую версию — максимум из прочитанных строк'''
+    _store(rows)
+    return max([_version] + [row[4] for row in rows])
+
+
+def _version_check_due() -> bool:
+    return _checked_at is None or time.monotonic() - _checked_at > PROFILE_CACHE_REFRESH
+
+
+def _missing(ids) -> list:
+    now = time.monotonic()
+    missing = []
+    for user_id in set(ids):
+        entry = _cache.get(user_id)
+        if entry is None or now - entry[0] > PROFILE_CACHE_TTL:
+            missing.append(user_id)
+    return missing
+
+
+def _result(ids) -> dict:
+    result = {}
+    for user_id in ids:
+        entry = _cache.get(user_id)
+        if entry is not None:
+            result[user_id] = entry[1]
+    return result
+
+
+def load(cur, ids) -> dict:
+    '''Профили (username, display_name, avatar_url) по id отправителей из кэша процесса.
+
+    Раз в PROFILE_CACHE_REFRESH секунд перечитывает профили с версией выше последней
+    увиденной (с запасом PROFILE_VERSION_OVERLAP); неизвестные id догружает одним запросом.
+    '''
+    global _version, _checked_at
+
+    if _version_check_due():
+        if _version is None:
+            cur.execute(LATEST_VERSION_SQL)
+            latest = _row(cur.fetchone())[0]
+        else:
+            cur.execute(CHANGED_SQL, (_version - PROFILE_VERSION_OVERLAP,))
+            latest = _refresh([_row(row) for row in cur.fetchall()])
+        _version, _checked_at = latest, time.monotonic()
+
+    missing = _missing(ids)
+    if missing:
+        cur.execute(BY_ID_SQL, (missing,))
+        _store(_row(row) for row in cur.fetchall())
+
+    return _result(ids)
+
+
+async def load_async(conn, ids) -> dict:
+    '''То же для asyncpg-соединения'''
+    global _version, _checked_at
+
+    if _version_check_due():
+        if _version is None:
+            latest = await conn.fetchval(LATEST_VERSION_SQL)
+        else:
+            latest = _refresh(await conn.fetch(CHANGED_SQL.replace('%s', '$1'), _version - PROFILE_VERSION_OVERLAP))
+        _version, _checked_at = latest, time.monotonic()
+
+    missing = _missing(ids)
+    if missing:
+        _store(await conn.fetch(BY_ID_SQL.replace('%s', '$1'), missing))
+
+    return _result(ids)
+
+
+def _row(row) -> tuple:
+    '''Строки RealDictCursor приводим к кортежу в порядке колонок запроса'''
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row)
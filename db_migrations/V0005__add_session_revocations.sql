@@ -0,0 +1,24 @@
+-- Список отзыва сессионных токенов: токены, выпущенные до revoked_at, больше не принимаются
+CREATE TABLE IF NOT EXISTS session_revocations (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    revoked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_session_revocations_revoked ON session_revocations(revoked_at DESC);
+
+-- Любая блокировка, разблокировка или смена прав отзывает ранее выданные токены
+CREATE OR REPLACE FUNCTION revoke_user_sessions() RETURNS trigger AS $$
+BEGIN
+    IF NEW.is_blocked IS DISTINCT FROM OLD.is_blocked OR NEW.is_admin IS DISTINCT FROM OLD.is_admin THEN
+        INSERT INTO session_revocations (user_id, revoked_at)
+        VALUES (NEW.id, clock_timestamp())
+        ON CONFLICT (user_id) DO UPDATE SET revoked_at = EXCLUDED.revoked_at;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_revoke_sessions ON users;
+CREATE TRIGGER trg_users_revoke_sessions
+    AFTER UPDATE OF is_blocked, is_admin ON users
+    FOR EACH ROW EXECUTE FUNCTION revoke_user_sessions();
@@ -0,0 +1,23 @@
+-- Версия профиля: растёт при каждом изменении username, display_name или avatar_url.
+-- По ней кэши профилей отправителей в функциях понимают, какие записи устарели.
+CREATE SEQUENCE IF NOT EXISTS users_profile_version_seq;
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_version BIGINT NOT NULL DEFAULT nextval('users_profile_version_seq');
+
+CREATE INDEX IF NOT EXISTS idx_users_profile_version ON users(profile_version);
+
+CREATE OR REPLACE FUNCTION bump_profile_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW.username IS DISTINCT FROM OLD.username
+       OR NEW.display_name IS DISTINCT FROM OLD.display_name
+       OR NEW.avatar_url IS DISTINCT FROM OLD.avatar_url THEN
+        NEW.profile_version := nextval('users_profile_version_seq');
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_profile_version ON users;
+CREATE TRIGGER trg_users_profile_version
+    BEFORE UPDATE OF username, display_name, avatar_url ON users
+    FOR EACH ROW EXECUTE FUNCTION bump_profile_version();
@@ -0,0 +1,33 @@
+-- Кэшированное число участников/подписчиков чата
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS member_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE chats c SET member_count = (SELECT COUNT(*) FROM chat_members cm WHERE cm.chat_id = c.id);
+
+CREATE OR REPLACE FUNCTION adjust_member_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE chats SET member_count = member_count + 1 WHERE id = NEW.chat_id;
+    ELSE
+        UPDATE chats SET member_count = member_count - 1 WHERE id = OLD.chat_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_chat_members_count ON chat_members;
+CREATE TRIGGER trg_chat_members_count
+    AFTER INSERT OR DELETE ON chat_members
+    FOR EACH ROW EXECUTE FUNCTION adjust_member_count();
+
+-- Отметка прочтения подписчика канала: всё с id <= last_read_message_id прочитано.
+-- В каналах read_by не ведётся, иначе массив рос бы до числа подписчиков.
+ALTER TABLE chat_members ADD COLUMN IF NOT EXISTS last_read_message_id INTEGER NOT NULL DEFAULT 0;
+
+UPDATE chat_members cm
+SET last_read_message_id = COALESCE(
+    (SELECT MAX(m.id) FROM messages m WHERE m.chat_id = cm.chat_id AND cm.user_id = ANY(m.read_by)), 0)
+FROM chats c
+WHERE c.id = cm.chat_id AND c.type = 'channel';
+
+-- Подсчёт непрочитанного по отметке и постраничный список подписчиков
+CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id, id);
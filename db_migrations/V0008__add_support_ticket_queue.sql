@@ -0,0 +1,6 @@
+-- Назначение тикета агенту поддержки с арендой: по истечении lease_expires_at тикет снова доступен в очереди
+ALTER TABLE support_tickets ADD COLUMN IF NOT EXISTS assigned_to INTEGER REFERENCES users(id);
+ALTER TABLE support_tickets ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+-- Очередь открытых тикетов в порядке поступления; закрытые в индекс не попадают
+CREATE INDEX IF NOT EXISTS idx_support_tickets_queue ON support_tickets(created_at) WHERE status = 'open';
@@ -0,0 +1,13 @@
+-- Курсор фонового задания очистки по каждой политике: всё с id <= last_id уже обработано
+CREATE TABLE IF NOT EXISTS retention_progress (
+    policy VARCHAR(50) PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    purged_total BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Архив для политик в режиме archive. Колонки совпадают с исходными таблицами по порядку,
+-- поэтому при изменении колонок исходной таблицы меняйте и архив.
+CREATE TABLE IF NOT EXISTS messages_archive (LIKE messages);
+CREATE TABLE IF NOT EXISTS support_messages_archive (LIKE support_messages);
+CREATE TABLE IF NOT EXISTS admin_actions_archive (LIKE admin_actions);
@@ -0,0 +1,33 @@
+-- Содержимое вложений хранится один раз на sha256; файлы лежат в ATTACHMENTS_DIR/blobs
+CREATE TABLE IF NOT EXISTS attachment_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Незавершённые загрузки по частям: received — сколько байт уже записано
+CREATE TABLE IF NOT EXISTS attachment_uploads (
+    id CHAR(32) PRIMARY KEY,
+    owner_id INTEGER NOT NULL REFERENCES users(id),
+    file_name TEXT NOT NULL,
+    mime_type VARCHAR(100) NOT NULL,
+    size BIGINT NOT NULL,
+    received BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Вложение — ссылка на blob. Пока message_id пуст, вложение видит только владелец;
+-- пересылка и повторная загрузка того же файла создают новую ссылку на тот же blob.
+CREATE TABLE IF NOT EXISTS attachments (
+    id SERIAL PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL REFERENCES attachment_blobs(sha256),
+    owner_id INTEGER NOT NULL REFERENCES users(id),
+    message_id INTEGER REFERENCES messages(id) ON DELETE CASCADE,
+    file_name TEXT NOT NULL,
+    mime_type VARCHAR(100) NOT NULL,
+    size BIGINT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_attachments_message ON attachments(message_id);
+CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments(sha256);
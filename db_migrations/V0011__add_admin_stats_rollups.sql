@@ -0,0 +1,157 @@
+-- Счётчики для статистики админки. Триггеры прибавляют к строке (metric, day, shard), где shard зависит
+-- от backend pid: параллельные вставки обновляют разные строки и не ждут друг друга. Значение — сумма по shard.
+-- Метрики по дням: messages, active_users, users_new, tickets_opened, tickets_closed.
+-- Изменения состояния (сумма за всё время даёт текущее значение): users_blocked, tickets_open.
+CREATE TABLE IF NOT EXISTS stats_daily (
+    metric VARCHAR(30) NOT NULL,
+    day DATE NOT NULL,
+    shard SMALLINT NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (metric, day, shard)
+);
+
+-- Кто уже писал в этот день: по нему active_users растёт только на первое сообщение пользователя за день.
+-- Старые дни удаляет stats_reconcile.
+CREATE TABLE IF NOT EXISTS stats_daily_active (
+    day DATE NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS stats_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    reconciled_at TIMESTAMP WITH TIME ZONE
+);
+INSERT INTO stats_state (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+-- Сверка по последним дням читает messages по created_at; BRIN почти ничего не стоит при вставке
+CREATE INDEX IF NOT EXISTS idx_messages_created_brin ON messages USING brin (created_at);
+
+CREATE OR REPLACE FUNCTION stats_bump(p_metric TEXT, p_day DATE, p_delta BIGINT) RETURNS void AS $$
+    INSERT INTO stats_daily (metric, day, shard, value)
+    VALUES (p_metric, p_day, pg_backend_pid() % 8, p_delta)
+    ON CONFLICT (metric, day, shard) DO UPDATE SET value = stats_daily.value + EXCLUDED.value;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION stats_on_message() RETURNS trigger AS $$
+BEGIN
+    PERFORM stats_bump('messages', NEW.created_at::date, 1);
+    IF NEW.sender_id IS NOT NULL THEN
+        INSERT INTO stats_daily_active (day, user_id) VALUES (NEW.created_at::date, NEW.sender_id)
+        ON CONFLICT DO NOTHING;
+        IF FOUND THEN
+            PERFORM stats_bump('active_users', NEW.created_at::date, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_messages_stats ON messages;
+CREATE TRIGGER trg_messages_stats
+    AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION stats_on_message();
+
+CREATE OR REPLACE FUNCTION stats_on_user() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM stats_bump('users_new', COALESCE(NEW.created_at, NOW())::date, 1);
+        IF NEW.is_blocked THEN
+            PERFORM stats_bump('users_blocked', CURRENT_DATE, 1);
+        END IF;
+    ELSIF NEW.is_blocked IS DISTINCT FROM OLD.is_blocked THEN
+        PERFORM stats_bump('users_blocked', CURRENT_DATE, CASE WHEN NEW.is_blocked THEN 1 ELSE -1 END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_stats ON users;
+CREATE TRIGGER trg_users_stats
+    AFTER INSERT OR UPDATE OF is_blocked ON users
+    FOR EACH ROW EXECUTE FUNCTION stats_on_user();
+
+CREATE OR REPLACE FUNCTION stats_on_ticket() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM stats_bump('tickets_opened', COALESCE(NEW.created_at, NOW())::date, 1);
+        IF NEW.status = 'open' THEN
+            PERFORM stats_bump('tickets_open', CURRENT_DATE, 1);
+        END IF;
+    ELSIF NEW.status IS DISTINCT FROM OLD.status THEN
+        IF OLD.status = 'open' THEN
+            PERFORM stats_bump('tickets_open', CURRENT_DATE, -1);
+        ELSIF NEW.status = 'open' THEN
+            PERFORM stats_bump('tickets_open', CURRENT_DATE, 1);
+        END IF;
+        IF NEW.status = 'closed' THEN
+            PERFORM stats_bump('tickets_closed', CURRENT_DATE, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_support_tickets_stats ON support_tickets;
+CREATE TRIGGER trg_support_tickets_stats
+    AFTER INSERT OR UPDATE OF status ON support_tickets
+    FOR EACH ROW EXECUTE FUNCTION stats_on_ticket();
+
+-- Сверка с базовыми таблицами: дневные метрики за последние p_days дней пересчитываются целиком,
+-- для метрик состояния разница с реальным значением дописывается в сегодняшний день.
+-- Запускается по расписанию (cron / pg_cron), а не из обработчиков.
+-- На время сверки триггеры ждут блокировку: иначе строка, вставленная между DELETE и пересчётом,
+-- попала бы и в новый shard, и в пересчёт, и сверка добавила бы расхождение вместо того, чтобы убрать.
+CREATE OR REPLACE FUNCTION stats_reconcile(p_days INTEGER DEFAULT 2) RETURNS void AS $$
+DECLARE
+    since DATE := CURRENT_DATE - p_days;
+BEGIN
+    LOCK TABLE stats_daily, stats_daily_active IN SHARE ROW EXCLUSIVE MODE;
+
+    DELETE FROM stats_daily
+    WHERE metric IN ('messages', 'active_users', 'users_new', 'tickets_opened') AND day >= since;
+
+    INSERT INTO stats_daily (metric, day, shard, value)
+    SELECT 'messages', created_at::date, 0, COUNT(*) FROM messages WHERE created_at >= since GROUP BY 2
+    UNION ALL
+    SELECT 'active_users', created_at::date, 0, COUNT(DISTINCT sender_id) FROM messages WHERE created_at >= since GROUP BY 2
+    UNION ALL
+    SELECT 'users_new', created_at::date, 0, COUNT(*) FROM users WHERE created_at >= since GROUP BY 2
+    UNION ALL
+    SELECT 'tickets_opened', created_at::date, 0, COUNT(*) FROM support_tickets WHERE created_at >= since GROUP BY 2
+    ON CONFLICT (metric, day, shard) DO UPDATE SET value = stats_daily.value + EXCLUDED.value;
+
+    DELETE FROM stats_daily_active WHERE day < since;
+    INSERT INTO stats_daily_active (day, user_id)
+    SELECT DISTINCT created_at::date, sender_id FROM messages WHERE created_at >= since AND sender_id IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    PERFORM stats_bump('users_blocked', CURRENT_DATE, drift)
+    FROM (SELECT (SELECT COUNT(*) FROM users WHERE is_blocked)
+                 - COALESCE((SELECT SUM(value) FROM stats_daily WHERE metric = 'users_blocked'), 0) AS drift) d
+    WHERE drift <> 0;
+
+    PERFORM stats_bump('tickets_open', CURRENT_DATE, drift)
+    FROM (SELECT (SELECT COUNT(*) FROM support_tickets WHERE status = 'open')
+                 - COALESCE((SELECT SUM(value) FROM stats_daily WHERE metric = 'tickets_open'), 0) AS drift) d
+    WHERE drift <> 0;
+
+    UPDATE stats_state SET reconciled_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Начальное заполнение по всей истории
+DELETE FROM stats_daily;
+
+INSERT INTO stats_daily (metric, day, shard, value)
+SELECT 'messages', created_at::date, 0, COUNT(*) FROM messages WHERE created_at IS NOT NULL GROUP BY 2
+UNION ALL
+SELECT 'active_users', created_at::date, 0, COUNT(DISTINCT sender_id) FROM messages WHERE created_at IS NOT NULL GROUP BY 2
+UNION ALL
+SELECT 'users_new', created_at::date, 0, COUNT(*) FROM users WHERE created_at IS NOT NULL GROUP BY 2
+UNION ALL
+SELECT 'tickets_opened', created_at::date, 0, COUNT(*) FROM support_tickets WHERE created_at IS NOT NULL GROUP BY 2
+UNION ALL
+SELECT 'tickets_closed', updated_at::date, 0, COUNT(*) FROM support_tickets WHERE status = 'closed' AND updated_at IS NOT NULL GROUP BY 2;
+
+SELECT stats_reconcile(2);
@@ -0,0 +1,3 @@
+-- Вложения архивируемых сообщений переносятся в архив вместе с ними: иначе ON DELETE CASCADE
+-- удалил бы их при переносе сообщения. Колонки совпадают с attachments по порядку.
+CREATE TABLE IF NOT EXISTS attachments_archive (LIKE attachments);
@@ -0,0 +1,48 @@
+-- Число участников чата вместо chats.member_count. Триггер прибавляет к строке (chat_id, shard), где shard
+-- зависит от backend pid: массовые подписки на один канал обновляют разные строки и не ждут друг друга
+-- на строке chats. Значение — сумма по shard.
+CREATE TABLE IF NOT EXISTS chat_member_counts (
+    chat_id INTEGER NOT NULL,
+    shard SMALLINT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, shard)
+);
+
+CREATE OR REPLACE FUNCTION adjust_member_count() RETURNS trigger AS $$
+BEGIN
+    -- Без внешнего ключа на chats: при удалении чата каскад по chat_members вызывает этот триггер уже без строки чата
+    INSERT INTO chat_member_counts (chat_id, shard, value)
+    VALUES (CASE WHEN TG_OP = 'INSERT' THEN NEW.chat_id ELSE OLD.chat_id END,
+            pg_backend_pid() % 8,
+            CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END)
+    ON CONFLICT (chat_id, shard) DO UPDATE SET value = chat_member_counts.value + EXCLUDED.value;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_chat_members_count ON chat_members;
+CREATE TRIGGER trg_chat_members_count
+    AFTER INSERT OR DELETE ON chat_members
+    FOR EACH ROW EXECUTE FUNCTION adjust_member_count();
+
+-- Счётчик меняется в той же транзакции, что и chat_members, поэтому не расходится с ним.
+-- Сжатие сворачивает shard каждого чата в одну строку и убирает строки удалённых чатов;
+-- запускается по расписанию (cron / pg_cron), как stats_reconcile.
+CREATE OR REPLACE FUNCTION chat_member_counts_compact() RETURNS void AS $$
+    WITH folded AS (
+        DELETE FROM chat_member_counts
+        RETURNING chat_id, value
+    )
+    INSERT INTO chat_member_counts (chat_id, shard, value)
+    SELECT f.chat_id, 0, SUM(f.value) FROM folded f
+    WHERE EXISTS (SELECT 1 FROM chats c WHERE c.id = f.chat_id)
+    GROUP BY f.chat_id
+    ON CONFLICT (chat_id, shard) DO UPDATE SET value = chat_member_counts.value + EXCLUDED.value;
+$$ LANGUAGE sql;
+
+-- Начальное заполнение
+DELETE FROM chat_member_counts;
+INSERT INTO chat_member_counts (chat_id, shard, value)
+SELECT chat_id, 0, COUNT(*) FROM chat_members GROUP BY chat_id;
+
+ALTER TABLE chats DROP COLUMN IF EXISTS member_count;
@@ -0,0 +1,18 @@
+import argparse
+import os
+
+import uvicorn
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Все функции backend/ в одном ASGI-процессе')
+    parser.add_argument('--host', default=os.environ.get('GATEWAY_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('GATEWAY_PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('GATEWAY_WORKERS', os.cpu_count() or 1)))
+    args = parser.parse_args()
+
+    uvicorn.run('gateway.app:app', host=args.host, port=args.port, workers=args.workers, lifespan='on')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import base64
+import importlib.util
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+from gateway.pool import PoolSet, RequestLease
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+FUNCTIONS = ('auth', 'chats', 'messages', 'support', 'admin')
+
+GATEWAY_THREADS = int(os.environ.get('GATEWAY_THREADS', '32'))
+GATEWAY_POOL_SIZE = int(os.environ.get('GATEWAY_POOL_SIZE', str(GATEWAY_THREADS)))
+GATEWAY_ASYNC_POOL_SIZE = int(os.environ.get('GATEWAY_ASYNC_POOL_SIZE', '20'))
+GATEWAY_ASYNC = os.environ.get('GATEWAY_ASYNC', '1') == '1' and asyncpg is not None
+
+
+class Context:
+    '''Замена облачного context: имя функции, id запроса и общие пулы БД'''
+
+    def __init__(self, function_name: str, db_pool: RequestLease = None, pg_pool=None):
+        self.function_name = function_name
+        self.request_id = uuid.uuid4().hex
+        self.db_pool = db_pool
+        self.pg_pool = pg_pool
+
+
+def _exec_module(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_handler(name: str):
+    '''Импортирует backend/<name>/index.py (и index_async.py, если есть) с собственными копиями session.py, db.py и т.д.'''
+    function_dir = BACKEND_DIR / name
+    local_modules = {path.stem for path in function_dir.glob('*.py')}
+
+    for module_name in local_modules:
+        sys.modules.pop(module_name, None)
+
+    sys.path.insert(0, str(function_dir))
+    try:
+        handler = _exec_module(f'backend_{name}', function_dir / 'index.py').handler
+        async_handler = None
+        if GATEWAY_ASYNC and (function_dir / 'index_async.py').exists():
+            async_handler = _exec_module(f'backend_{name}_async', function_dir / 'index_async.py').handler
+    finally:
+        sys.path.remove(str(function_dir))
+        for module_name in local_modules:
+            sys.modules.pop(module_name, None)
+
+    return handler, async_handler
+
+
+class Gateway:
+    '''ASGI-приложение: /<function> вызывает handler(event, context) соответствующей функции.
+
+    Функции с index_async.py обслуживаются прямо в event loop через asyncpg,
+    остальные — в ограниченном пуле потоков через psycopg2.
+    '''
+
+    def __init__(self):
+        self.handlers = {}
+        self.async_handlers = {}
+        for name in FUNCTIONS:
+            self.handlers[name], self.async_handlers[name] = load_handler(name)
+        self.pool = None
+        self.pg_pool = None
+        self.executor = None
+        self.slots = None
+
+    async def startup(self) -> None:
+        self.pool = PoolSet(os.environ['DATABASE_URL'], GATEWAY_POOL_SIZE)
+        self.executor = ThreadPoolExecutor(max_workers=GATEWAY_THREADS, thread_name_prefix='handler')
+        self.slots = asyncio.Semaphore(GATEWAY_THREADS)
+        if any(self.async_handlers.values()):
+            self.pg_pool = await asyncpg.create_pool(os.environ['DATABASE_URL'], max_size=GATEWAY_ASYNC_POOL_SIZE)
+
+    async def shutdown(self) -> None:
+        if self.pg_pool is not None:
+            await self.pg_pool.close()
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        name = scope['path'].strip('/').split('/', 1)[0]
+        handler = self.handlers.get(name)
+
+        if handler is None:
+            await self._respond(send, {'statusCode': 404, 'headers': {}, 'body': '', 'isBase64Encoded': False})
+            return
+
+        event = await self._event(scope, receive)
+
+        async_handler = self.async_handlers.get(name)
+        if async_handler is not None:
+            await self._respond(send, await async_handler(event, Context(name, pg_pool=self.pg_pool)))
+            return
+
+        lease = RequestLease(self.pool)
+
+        def invoke():
+            try:
+                return handler(event, Context(name, lease))
+            finally:
+                lease.release_all()
+
+        async with self.slots:
+            response = await asyncio.get_running_loop().run_in_executor(self.executor, invoke)
+
+        await self._respond(send, response)
+
+    async def _event(self, scope, receive) -> dict:
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        headers = {}
+        for key, value in scope['headers']:
+            headers[key.decode('latin-1').title()] = value.decode('latin-1')
+
+        try:
+            body_text = body.decode('utf-8')
+            is_base64 = False
+        except UnicodeDecodeError:
+            body_text = base64.b64encode(body).decode('ascii')
+            is_base64 = True
+
+        client = scope.get('client') or ('', 0)
+        return {
+            'httpMethod': scope['method'],
+            'path': scope['path'],
+            'headers': headers,
+            'queryStringParameters': dict(parse_qsl(scope['query_string'].decode('latin-1'))),
+            'body': body_text,
+            'isBase64Encoded': is_base64,
+            'requestContext': {'identity': {'sourceIp': client[0]}}
+        }
+
+    async def _respond(self, send, response: dict) -> None:
+        body = response.get('body') or ''
+        if response.get('isBase64Encoded'):
+            payload = base64.b64decode(body)
+        else:
+            payload = body.encode('utf-8') if isinstance(body, str) else body
+
+        headers = [
+            (str(key).encode('latin-1'), str(value).encode('latin-1'))
+            for key, value in (response.get('headers') or {}).items()
+        ]
+        await send({'type': 'http.response.start', 'status': response['statusCode'], 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+app = Gateway()
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+# Соединение, пролежавшее в пуле дольше, проверяется запросом SELECT 1 перед выдачей
+GATEWAY_POOL_CHECK_IDLE = float(os.environ.get('GATEWAY_POOL_CHECK_IDLE', '30'))
+
+
+class SharedPool:
+    '''Общий пул соединений процесса; при исчерпании ждёт освобождения вместо ошибки'''
+
+    def __init__(self, dsn: str, maxconn: int):
+        self._pool = ThreadedConnectionPool(1, maxconn, dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._maxconn = maxconn
+        self._idle_since = {}
+
+    def acquire(self):
+        '''Рабочее соединение: разорванные (рестарт сервера, обрыв сети) закрываются и заменяются новыми'''
+        self._slots.acquire()
+        try:
+            # В пуле может лежать не больше maxconn соединений; следующее после них открыто заново
+            for _ in range(self._maxconn + 1):
+                conn = self._pool.getconn()
+                if self._usable(conn):
+                    return conn
+                self._pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError('No usable database connection')
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _usable(self, conn) -> bool:
+        idle_since = self._idle_since.pop(id(conn), None)
+        if conn.closed:
+            return False
+        try:
+            # poll() читает то, что уже пришло в сокет, и замечает закрытие со стороны сервера без запроса
+            conn.poll()
+            if idle_since is not None and time.monotonic() - idle_since > GATEWAY_POOL_CHECK_IDLE:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def release(self, conn) -> None:
+        try:
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+            else:
+                conn.rollback()
+                self._idle_since[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        except Exception:
+            self._idle_since.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+class PoolSet:
+    '''Пулы по DSN: основной DATABASE_URL и реплики, которые просят обработчики'''
+
+    def __init__(self, default_dsn: str, maxconn: int):
+        self.default_dsn = default_dsn
+        self._maxconn = maxconn
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, dsn: str = None) -> SharedPool:
+        dsn = dsn or self.default_dsn
+        with self._lock:
+            if dsn not in self._pools:
+                self._pools[dsn] = SharedPool(dsn, self._maxconn)
+            return self._pools[dsn]
+
+    def close(self) -> None:
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+class PooledConnection:
+    '''Обёртка над соединением из пула: close() возвращает его в пул, а не закрывает'''
+
+    def __init__(self, lease: 'RequestLease', pool: SharedPool, conn):
+        self._lease = lease
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def raw(self):
+        '''Само psycopg2-соединение: по нему db.py помнит подготовленные запросы'''
+        return self._conn
+
+    def close(self) -> None:
+        self._lease.release(self)
+
+
+class RequestLease:
+    '''Соединения, взятые одним запросом; всё, что обработчик не закрыл сам, возвращается в finally'''
+
+    def __init__(self, pools: PoolSet):
+        self._pools = pools
+        self._held = []
+
+    def connect(self, dsn: str = None) -> PooledConnection:
+        pool = self._pools.get(dsn)
+        conn = PooledConnection(self, pool, pool.acquire())
+        self._held.append(conn)
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        if conn in self._held:
+            self._held.remove(conn)
+            conn._pool.release(conn._conn)
+
+    def release_all(self) -> None:
+        for conn in list(self._held):
+            self.release(conn)
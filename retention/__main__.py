@@ -0,0 +1,34 @@
+import argparse
+import logging
+import os
+import time
+
+from retention.job import parse_policies, run
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Пакетная очистка старых сообщений, истории поддержки и журнала админов')
+    parser.add_argument('--policies', default=os.environ.get('RETENTION_POLICIES', ''))
+    parser.add_argument('--interval', type=float, default=None, help='повторять проход каждые N секунд')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    policies = parse_policies(args.policies)
+    if not policies:
+        parser.error('no retention policies configured (RETENTION_POLICIES or --policies)')
+
+    if args.interval is None:
+        run(os.environ['DATABASE_URL'], policies)
+        return
+
+    while True:
+        try:
+            run(os.environ['DATABASE_URL'], policies)
+        except Exception:
+            # Следующий проход продолжит с сохранённых курсоров
+            logging.getLogger('retention').exception('retention pass failed')
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
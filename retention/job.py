@@ -0,0 +1,219 @@
+import logging
+import os
+import time
+
+import psycopg2
+from psycopg2 import errors
+
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', '1000'))
+RETENTION_BATCH_PAUSE = float(os.environ.get('RETENTION_BATCH_PAUSE', '0.2'))
+RETENTION_LOCK_TIMEOUT = os.environ.get('RETENTION_LOCK_TIMEOUT', '2s')
+RETENTION_MAX_RETRIES = int(os.environ.get('RETENTION_MAX_RETRIES', '5'))
+
+log = logging.getLogger('retention')
+
+# Запросы просмотра идут по первичному ключу и для каждой строки возвращают решение:
+#   purge — строка старше срока и подпадает под политику;
+#   skip  — не подпадает и не подпадёт никогда (другой тип чата), курсор можно сдвигать дальше;
+#   hold  — пока не подпадает (тикет ещё открыт), курсор дальше не двигаем, чтобы вернуться к ней в следующий раз;
+#   stop  — строка моложе срока; id растут вместе с created_at, поэтому дальше смотреть нечего.
+SCAN_SQL = {
+    'messages': """
+        SELECT m.id,
+               CASE WHEN m.created_at >= NOW() - make_interval(days => %(days)s) THEN 'stop'
+                    WHEN c.type = %(kind)s THEN 'purge'
+                    ELSE 'skip' END
+        FROM messages m
+        JOIN chats c ON c.id = m.chat_id
+        WHERE m.id > %(after)s
+        ORDER BY m.id
+        LIMIT %(limit)s
+    """,
+    'support_messages': """
+        SELECT sm.id,
+               CASE WHEN sm.created_at >= NOW() - make_interval(days => %(days)s) THEN 'stop'
+                    WHEN st.status = 'closed' THEN 'purge'
+                    ELSE 'hold' END
+        FROM support_messages sm
+        JOIN support_tickets st ON st.id = sm.ticket_id
+        WHERE sm.id > %(after)s
+        ORDER BY sm.id
+        LIMIT %(limit)s
+    """,
+    'admin_actions': """
+        SELECT id,
+               CASE WHEN created_at >= NOW() - make_interval(days => %(days)s) THEN 'stop'
+                    ELSE 'purge' END
+        FROM admin_actions
+        WHERE id > %(after)s
+        ORDER BY id
+        LIMIT %(limit)s
+    """,
+}
+
+# Строки, которые удаляются каскадом вместе с исходной таблицей: в режиме archive они переносятся
+# в <таблица>_archive в той же пачке, до самих строк
+ARCHIVE_DEPENDENTS = {
+    'messages': [('attachments', 'message_id')],
+}
+
+PROGRESS_SQL = """
+    INSERT INTO retention_progress (policy) VALUES (%s)
+    ON CONFLICT (policy) DO UPDATE SET policy = EXCLUDED.policy
+    RETURNING last_id, purged_total
+"""
+SAVE_PROGRESS_SQL = """
+    UPDATE retention_progress
+    SET last_id = %s, purged_total = purged_total + %s, updated_at = NOW()
+    WHERE policy = %s
+"""
+
+
+class Policy:
+    '''Срок хранения строк одной таблицы (для messages — одного типа чата)'''
+
+    def __init__(self, name: str, table: str, days: int, archive: bool = False, kind: str = None):
+        self.name = name
+        self.table = table
+        self.days = days
+        self.archive = archive
+        self.kind = kind
+
+    def purge_sql(self) -> list:
+        '''Запросы для одной пачки id по порядку; в режиме archive сначала переносятся зависимые строки'''
+        if self.archive:
+            return [
+                f"""
+                    WITH moved AS (DELETE FROM {table} WHERE {column} = ANY(%s) RETURNING *)
+                    INSERT INTO {table}_archive SELECT * FROM moved
+                """
+                for table, column in ARCHIVE_DEPENDENTS.get(self.table, []) + [(self.table, 'id')]
+            ]
+        return [f"DELETE FROM {self.table} WHERE id = ANY(%s)"]
+
+
+def parse_policies(spec: str) -> list:
+    '''RETENTION_POLICIES: "messages.channel=90,messages.chat=365,support_messages=180:archive,admin_actions=730".
+
+    Число — срок хранения в днях; суффикс :archive переносит строки в <таблица>_archive вместо удаления.
+    '''
+    policies = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        days, _, mode = value.partition(':')
+        table, _, kind = name.partition('.')
+
+        if table not in SCAN_SQL:
+            raise ValueError(f'Unknown retention table: {table}')
+        if (table == 'messages') != bool(kind):
+            raise ValueError(f'Chat type is required for messages and only for messages: {name}')
+        if mode not in ('', 'archive', 'delete'):
+            raise ValueError(f'Unknown retention mode: {mode}')
+
+        policies.append(Policy(name, table, int(days), mode == 'archive', kind or None))
+    return policies
+
+
+def run_policy(conn, policy: Policy, batch_size: int = None, pause: float = None) -> int:
+    '''Один проход политики небольшими пачками, каждая в своей короткой транзакции.
+
+    Курсор сохраняется в retention_progress вместе с удалением, поэтому прерванный проход
+    продолжается с того же места. Возвращает число обработанных строк.
+    '''
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    pause = RETENTION_BATCH_PAUSE if pause is None else pause
+
+    cur = conn.cursor()
+
+    # Второй экземпляр задания ту же политику не трогает
+    cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", ('retention:' + policy.name,))
+    if not cur.fetchone()[0]:
+        conn.commit()
+        log.info('%s: already running elsewhere, skipped', policy.name)
+        return 0
+
+    try:
+        return _run_locked(conn, cur, policy, batch_size, pause)
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", ('retention:' + policy.name,))
+        conn.commit()
+
+
+def _run_locked(conn, cur, policy: Policy, batch_size: int, pause: float) -> int:
+    cur.execute(PROGRESS_SQL, (policy.name,))
+    resume_id, purged_total = cur.fetchone()
+    conn.commit()
+
+    scan_id = resume_id
+    held = False
+    purged_run = 0
+    started = time.monotonic()
+    retries = 0
+
+    while True:
+        try:
+            purge, next_scan, next_resume, next_held, done = _batch(cur, policy, batch_size, scan_id, resume_id, held)
+            conn.commit()
+        except (errors.LockNotAvailable, errors.QueryCanceled) as e:
+            # Пачка откатилась целиком, курсор в retention_progress не сдвинулся — ту же пачку можно повторить
+            conn.rollback()
+            retries += 1
+            if retries > RETENTION_MAX_RETRIES:
+                log.warning('%s: lock timeout %d times in a row, leaving the rest for the next run', policy.name, retries)
+                return purged_run
+            backoff = max(pause, 0.1) * 2 ** retries
+            log.warning('%s: lock timeout (%s), retry %d in %.1fs', policy.name, e.pgcode, retries, backoff)
+            time.sleep(backoff)
+            continue
+
+        retries = 0
+        scan_id, resume_id, held = next_scan, next_resume, next_held
+        purged_run += len(purge)
+        purged_total += len(purge)
+        elapsed = time.monotonic() - started
+        log.info(
+            '%s: %d rows this batch, %d this run (%.0f rows/s), %d total, cursor %d',
+            policy.name, len(purge), purged_run, purged_run / elapsed if elapsed else 0.0, purged_total, scan_id
+        )
+
+        if done:
+            return purged_run
+        time.sleep(pause)
+
+
+def _batch(cur, policy: Policy, batch_size: int, scan_id: int, resume_id: int, held: bool) -> tuple:
+    '''Одна пачка в текущей транзакции; новое положение курсора применяется только после коммита'''
+    cur.execute(f"SET LOCAL lock_timeout = '{RETENTION_LOCK_TIMEOUT}'")
+    cur.execute(SCAN_SQL[policy.table], {
+        'days': policy.days, 'kind': policy.kind, 'after': scan_id, 'limit': batch_size
+    })
+    rows = cur.fetchall()
+
+    purge = []
+    done = len(rows) < batch_size
+    for row_id, verdict in rows:
+        if verdict == 'stop':
+            done = True
+            break
+        if verdict == 'purge':
+            purge.append(row_id)
+        elif verdict == 'hold':
+            held = True
+        scan_id = row_id
+        if not held:
+            resume_id = row_id
+
+    if purge:
+        for sql in policy.purge_sql():
+            cur.execute(sql, (purge,))
+    cur.execute(SAVE_PROGRESS_SQL, (resume_id, len(purge), policy.name))
+    return purge, scan_id, resume_id, held, done
+
+
+def run(dsn: str, policies: list) -> int:
+    conn = psycopg2.connect(dsn)
+    try:
+        return sum(run_policy(conn, policy) for policy in policies)
+    finally:
+        conn.close()
@@ -0,0 +1,43 @@
+import { useEffect, useState } from 'react';
+import Icon from '@/components/ui/icon';
+import { Attachment, attachmentObjectUrl } from '@/lib/attachments';
+
+type AttachmentViewProps = {
+  api: string;
+  attachment: Attachment;
+};
+
+export default function AttachmentView({ api, attachment }: AttachmentViewProps) {
+  const [thumbUrl, setThumbUrl] = useState<string | null>(null);
+  const isImage = attachment.mime_type.startsWith('image/');
+
+  useEffect(() => {
+    if (!isImage) return;
+    let url: string | null = null;
+    attachmentObjectUrl(api, attachment.id, true)
+      .then((objectUrl) => {
+        url = objectUrl;
+        setThumbUrl(objectUrl);
+      })
+      .catch(() => setThumbUrl(null));
+    return () => {
+      if (url) URL.revokeObjectURL(url);
+    };
+  }, [api, attachment.id, isImage]);
+
+  const open = async () => {
+    const url = await attachmentObjectUrl(api, attachment.id);
+    window.open(url, '_blank');
+  };
+
+  if (thumbUrl) {
+    return <img src={thumbUrl} alt={attachment.file_name} className="rounded-lg max-w-full cursor-pointer mt-1" onClick={open} />;
+  }
+
+  return (
+    <button type="button" onClick={open} className="flex items-center gap-2 text-sm underline mt-1">
+      <Icon name="Paperclip" className="w-4 h-4" />
+      {attachment.file_name}
+    </button>
+  );
+}
@@ -0,0 +1,62 @@
+import { apiFetch, authHeaders } from '@/lib/session';
+
+export type Attachment = {
+  id: number;
+  file_name: string;
+  mime_type: string;
+  size: number;
+};
+
+async function sha256Hex(file: File): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+async function postJson(api: string, body: object) {
+  const response = await apiFetch(api, {
+    method: 'POST',
+    headers: authHeaders({ 'Content-Type': 'application/json' }),
+    body: JSON.stringify(body),
+  });
+  const data = await response.json();
+  if (!response.ok) throw new Error(data.error);
+  return data;
+}
+
+// Uploads a file in chunks and returns the attachment id. A file the user can already see is not uploaded again.
+export async function uploadAttachment(api: string, file: File): Promise<number> {
+  const start = await postJson(api, {
+    action: 'upload_start',
+    file_name: file.name,
+    mime_type: file.type || 'application/octet-stream',
+    size: file.size,
+    sha256: await sha256Hex(file),
+  });
+  if (start.attachment_id) return start.attachment_id;
+
+  let offset = 0;
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + start.chunk_size);
+    const response = await apiFetch(`${api}?action=upload_chunk&upload_id=${start.upload_id}&offset=${offset}`, {
+      method: 'POST',
+      headers: authHeaders({ 'Content-Type': 'application/octet-stream' }),
+      body: chunk,
+    });
+    const data = await response.json();
+    // 409: the server already has a different prefix (e.g. a retried chunk did land), so continue from its offset
+    if (!response.ok && !(response.status === 409 && typeof data.received === 'number')) throw new Error(data.error);
+    offset = data.received;
+  }
+
+  const complete = await postJson(api, { action: 'upload_complete', upload_id: start.upload_id });
+  return complete.attachment_id;
+}
+
+// Downloads need the session header, so <img src> can't point at the API directly.
+export async function attachmentObjectUrl(api: string, id: number, thumb = false): Promise<string> {
+  const response = await apiFetch(`${api}?action=attachment&id=${id}${thumb ? '&thumb=1' : ''}`, {
+    headers: authHeaders(),
+  });
+  if (!response.ok) throw new Error('Failed to load attachment');
+  return URL.createObjectURL(await response.blob());
+}
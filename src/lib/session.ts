@@ -0,0 +1,32 @@
+export function getSessionToken(): string | null {
+  const savedUser = localStorage.getItem('currentUser');
+  if (!savedUser) return null;
+  return JSON.parse(savedUser).token ?? null;
+}
+
+export function authHeaders(extra: Record<string, string> = {}): Record<string, string> {
+  const headers = { ...extra };
+  const token = getSessionToken();
+  if (token) headers['X-Auth-Token'] = token;
+  const lsn = localStorage.getItem('dbLsn');
+  if (lsn) headers['X-Db-Lsn'] = lsn;
+  return headers;
+}
+
+// Backend returns X-Db-Lsn after writes; sending it back lets reads go to a replica that already has them.
+export async function apiFetch(input: string, init?: RequestInit): Promise<Response> {
+  const response = await fetch(input, init);
+  const lsn = response.headers.get('X-Db-Lsn');
+  if (lsn) localStorage.setItem('dbLsn', lsn);
+  return response;
+}
+
+type SenderProfile = { username: string; display_name: string; avatar_url?: string };
+
+// Expands a view=compact page ({ messages, senders }) back into messages with sender fields inline.
+export function withSenders<T extends { sender_id: number }>(page: {
+  messages: T[];
+  senders: Record<string, SenderProfile>;
+}): (T & SenderProfile)[] {
+  return page.messages.map((message) => ({ ...message, ...page.senders[message.sender_id] }));
+}
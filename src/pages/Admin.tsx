@@ -16,6 +16,7 @@ import {
   DialogFooter,
 } from '@/components/ui/dialog';
 import { Label } from '@/components/ui/label';
+import { apiFetch, authHeaders, withSenders } from '@/lib/session';
 
 const API_ADMIN = 'https://functions.poehali.dev/afa0b253-f082-4403-9685-5941d5cc7bf7';
 const API_SUPPORT = 'https://functions.poehali.dev/a6c5b7a0-809f-4c1e-8745-26b11f71e3de';
@@ -58,16 +59,29 @@ type SupportMessage = {
   display_name: string;
 };
 
+type Stats = {
+  totals: { users: number; blocked_users: number; open_tickets: number };
+  series: {
+    day: string;
+    messages: number;
+    active_users: number;
+    new_users: number;
+    tickets_opened: number;
+    tickets_closed: number;
+  }[];
+  reconciled_at: string | null;
+};
+
 type AdminProps = {
-  adminId: number;
   onBack: () => void;
 };
 
-export default function Admin({ adminId, onBack }: AdminProps) {
+export default function Admin({ onBack }: AdminProps) {
   const { toast } = useToast();
   const [users, setUsers] = useState<User[]>([]);
   const [ipBlocks, setIPBlocks] = useState<IPBlock[]>([]);
   const [supportTickets, setSupportTickets] = useState<SupportTicket[]>([]);
+  const [stats, setStats] = useState<Stats | null>(null);
   const [selectedTicket, setSelectedTicket] = useState<SupportTicket | null>(null);
   const [ticketMessages, setTicketMessages] = useState<SupportMessage[]>([]);
   const [replyText, setReplyText] = useState('');
@@ -96,8 +110,8 @@ export default function Admin({ adminId, onBack }: AdminProps) {
 
   const loadUsers = async () => {
     try {
-      const response = await fetch(`${API_ADMIN}?action=users`, {
-        headers: { 'X-Admin-Id': adminId.toString() },
+      const response = await apiFetch(`${API_ADMIN}?action=users`, {
+        headers: authHeaders(),
       });
       const data = await response.json();
       if (response.ok) {
@@ -110,8 +124,8 @@ export default function Admin({ adminId, onBack }: AdminProps) {
 
   const loadIPBlocks = async () => {
     try {
-      const response = await fetch(`${API_ADMIN}?action=ip_blocks`, {
-        headers: { 'X-Admin-Id': adminId.toString() },
+      const response = await apiFetch(`${API_ADMIN}?action=ip_blocks`, {
+        headers: authHeaders(),
       });
       const data = await response.json();
       if (response.ok) {
@@ -122,9 +136,21 @@ export default function Admin({ adminId, onBack }: AdminProps) {
     }
   };
 
+  const loadStats = async () => {
+    try {
+      const response = await apiFetch(`${API_ADMIN}?action=stats&days=14`, { headers: authHeaders() });
+      const data = await response.json();
+      if (response.ok) {
+        setStats(data);
+      }
+    } catch (error) {
+      console.error('Failed to load stats', error);
+    }
+  };
+
   const loadSupportTickets = async () => {
     try {
-      const response = await fetch(`${API_SUPPORT}?action=tickets&status=open`);
+      const response = await apiFetch(`${API_SUPPORT}?action=tickets&status=open`, { headers: authHeaders() });
       const data = await response.json();
       if (response.ok) {
         setSupportTickets(data);
@@ -136,10 +162,10 @@ export default function Admin({ adminId, onBack }: AdminProps) {
 
   const loadTicketMessages = async (ticketId: number) => {
     try {
-      const response = await fetch(`${API_SUPPORT}?action=messages&ticket_id=${ticketId}`);
+      const response = await apiFetch(`${API_SUPPORT}?action=messages&ticket_id=${ticketId}&view=compact`, { headers: authHeaders() });
       const data = await response.json();
       if (response.ok) {
-        setTicketMessages(data);
+        setTicketMessages(withSenders(data));
       }
     } catch (error) {
       console.error('Failed to load messages', error);
@@ -150,12 +176,9 @@ export default function Admin({ adminId, onBack }: AdminProps) {
     if (!selectedUser) return;
 
     try {
-      const response = await fetch(API_ADMIN, {
+      const response = await apiFetch(API_ADMIN, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-Admin-Id': adminId.toString(),
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'block_user',
           user_id: selectedUser.id,
@@ -176,12 +199,9 @@ export default function Admin({ adminId, onBack }: AdminProps) {
 
   const handleUnblockUser = async (userId: number) => {
     try {
-      const response = await fetch(API_ADMIN, {
+      const response = await apiFetch(API_ADMIN, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-Admin-Id': adminId.toString(),
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'unblock_user',
           user_id: userId,
@@ -204,12 +224,9 @@ export default function Admin({ adminId, onBack }: AdminProps) {
     }
 
     try {
-      const response = await fetch(API_ADMIN, {
+      const response = await apiFetch(API_ADMIN, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-Admin-Id': adminId.toString(),
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'block_ip',
           ip_address: ipAddress,
@@ -231,12 +248,9 @@ export default function Admin({ adminId, onBack }: AdminProps) {
 
   const handleUnblockIP = async (ip: string) => {
     try {
-      const response = await fetch(API_ADMIN, {
+      const response = await apiFetch(API_ADMIN, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-Admin-Id': adminId.toString(),
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'unblock_ip',
           ip_address: ip,
@@ -256,13 +270,12 @@ export default function Admin({ adminId, onBack }: AdminProps) {
     if (!replyText.trim() || !selectedTicket) return;
 
     try {
-      const response = await fetch(API_SUPPORT, {
+      const response = await apiFetch(API_SUPPORT, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'send_message',
           ticket_id: selectedTicket.id,
-          sender_id: adminId,
           message: replyText,
           is_admin_reply: true,
         }),
@@ -281,9 +294,9 @@ export default function Admin({ adminId, onBack }: AdminProps) {
     if (!selectedTicket) return;
 
     try {
-      const response = await fetch(API_SUPPORT, {
+      const response = await apiFetch(API_SUPPORT, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'close_ticket',
           ticket_id: selectedTicket.id,
@@ -300,6 +313,27 @@ export default function Admin({ adminId, onBack }: AdminProps) {
     }
   };
 
+  const handleClaimTicket = async () => {
+    try {
+      const response = await apiFetch(API_SUPPORT, {
+        method: 'POST',
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
+        body: JSON.stringify({ action: 'claim_ticket' }),
+      });
+      const data = await response.json();
+
+      if (response.ok) {
+        if (data.ticket) {
+          setSelectedTicket(data.ticket);
+        } else {
+          toast({ title: 'Очередь пуста' });
+        }
+      }
+    } catch (error) {
+      toast({ title: 'Ошибка получения обращения', variant: 'destructive' });
+    }
+  };
+
   const formatTime = (isoString: string) => {
     const date = new Date(isoString);
     return date.toLocaleString('ru', {
@@ -390,10 +424,18 @@ export default function Admin({ adminId, onBack }: AdminProps) {
           <TabsTrigger value="ip" className="flex-1">
             IP блокировки
           </TabsTrigger>
+          <TabsTrigger value="stats" className="flex-1" onClick={loadStats}>
+            Статистика
+          </TabsTrigger>
         </TabsList>
 
         <TabsContent value="support" className="flex-1 overflow-hidden mt-0">
           <div className="h-full flex flex-col">
+            <div className="p-4 pb-0">
+              <Button className="w-full" onClick={handleClaimTicket}>
+                Взять следующее обращение
+              </Button>
+            </div>
             <ScrollArea className="flex-1 p-4">
               {supportTickets.length === 0 ? (
                 <div className="flex flex-col items-center justify-center h-full text-center p-8">
@@ -532,6 +574,59 @@ export default function Admin({ adminId, onBack }: AdminProps) {
             </ScrollArea>
           </div>
         </TabsContent>
+
+        <TabsContent value="stats" className="flex-1 overflow-hidden mt-0">
+          <ScrollArea className="h-full p-4">
+            {stats && (
+              <div className="space-y-3">
+                <div className="grid grid-cols-3 gap-3">
+                  <Card>
+                    <CardHeader className="p-4">
+                      <p className="text-xs text-muted-foreground">Пользователи</p>
+                      <CardTitle className="text-2xl">{stats.totals.users}</CardTitle>
+                    </CardHeader>
+                  </Card>
+                  <Card>
+                    <CardHeader className="p-4">
+                      <p className="text-xs text-muted-foreground">Заблокированы</p>
+                      <CardTitle className="text-2xl">{stats.totals.blocked_users}</CardTitle>
+                    </CardHeader>
+                  </Card>
+                  <Card>
+                    <CardHeader className="p-4">
+                      <p className="text-xs text-muted-foreground">Открытые обращения</p>
+                      <CardTitle className="text-2xl">{stats.totals.open_tickets}</CardTitle>
+                    </CardHeader>
+                  </Card>
+                </div>
+                <table className="w-full text-sm">
+                  <thead>
+                    <tr className="text-left text-muted-foreground">
+                      <th className="py-1">День</th>
+                      <th className="py-1">Сообщения</th>
+                      <th className="py-1">Активные</th>
+                      <th className="py-1">Новые</th>
+                      <th className="py-1">Обращения</th>
+                    </tr>
+                  </thead>
+                  <tbody>
+                    {stats.series.map((row) => (
+                      <tr key={row.day} className="border-t">
+                        <td className="py-1">{row.day}</td>
+                        <td className="py-1">{row.messages}</td>
+                        <td className="py-1">{row.active_users}</td>
+                        <td className="py-1">{row.new_users}</td>
+                        <td className="py-1">
+                          {row.tickets_opened} / {row.tickets_closed}
+                        </td>
+                      </tr>
+                    ))}
+                  </tbody>
+                </table>
+              </div>
+            )}
+          </ScrollArea>
+        </TabsContent>
       </Tabs>
 
       <Dialog open={blockUserDialog} onOpenChange={setBlockUserDialog}>
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Avatar, AvatarFallback, AvatarImage } from '@/components/ui/avatar';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -9,6 +9,9 @@ import { Badge } from '@/components/ui/badge';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/ui/dialog';
 import { Label } from '@/components/ui/label';
 import { useToast } from '@/hooks/use-toast';
+import { apiFetch, authHeaders, withSenders } from '@/lib/session';
+import { Attachment, uploadAttachment } from '@/lib/attachments';
+import AttachmentView from '@/components/AttachmentView';
 import Support from './Support';
 import Admin from './Admin';
 
@@ -24,6 +27,7 @@ type User = {
   bio?: string;
   avatar_url?: string;
   is_admin?: boolean;
+  token?: string;
 };
 
 type Chat = {
@@ -35,6 +39,7 @@ type Chat = {
   last_message_time?: string;
   unread_count: number;
   members?: User[];
+  member_count?: number;
 };
 
 type Message = {
@@ -46,6 +51,7 @@ type Message = {
   display_name: string;
   avatar_url?: string;
   read_by: number[];
+  attachments?: Attachment[];
 };
 
 const Index = () => {
@@ -54,6 +60,8 @@ const Index = () => {
   const [currentUser, setCurrentUser] = useState<User | null>(null);
   const [selectedChat, setSelectedChat] = useState<Chat | null>(null);
   const [messageText, setMessageText] = useState('');
+  const [pendingAttachments, setPendingAttachments] = useState<{ id: number; name: string }[]>([]);
+  const fileInputRef = useRef<HTMLInputElement>(null);
   const [searchQuery, setSearchQuery] = useState('');
   const [createChatOpen, setCreateChatOpen] = useState(false);
   const [searchUsersOpen, setSearchUsersOpen] = useState(false);
@@ -98,7 +106,7 @@ const Index = () => {
 
     setLoading(true);
     try {
-      const response = await fetch(API_AUTH, {
+      const response = await apiFetch(API_AUTH, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ phone, username, display_name: displayName }),
@@ -124,10 +132,14 @@ const Index = () => {
 
   const loadChats = async (userId: number) => {
     try {
-      const response = await fetch(`${API_CHATS}?user_id=${userId}`);
+      const response = await apiFetch(`${API_CHATS}?user_id=${userId}`, { headers: authHeaders() });
       const data = await response.json();
       if (response.ok) {
         setChats(data);
+      } else if (response.status === 401) {
+        localStorage.removeItem('currentUser');
+        setCurrentUser(null);
+        setView('auth');
       }
     } catch (error) {
       console.error('Failed to load chats', error);
@@ -137,32 +149,45 @@ const Index = () => {
   const loadMessages = async (chatId: number) => {
     if (!currentUser) return;
     try {
-      const response = await fetch(`${API_MESSAGES}?chat_id=${chatId}&user_id=${currentUser.user_id}`);
+      const response = await apiFetch(`${API_MESSAGES}?chat_id=${chatId}&view=compact`, { headers: authHeaders() });
       const data = await response.json();
       if (response.ok) {
-        setMessages(data);
+        setMessages(withSenders(data));
       }
     } catch (error) {
       console.error('Failed to load messages', error);
     }
   };
 
+  const handleAttachFile = async (file: File | undefined) => {
+    if (!file) return;
+    try {
+      const id = await uploadAttachment(API_MESSAGES, file);
+      setPendingAttachments((prev) => [...prev, { id, name: file.name }]);
+    } catch (error) {
+      toast({ title: 'Ошибка загрузки файла', variant: 'destructive' });
+    } finally {
+      if (fileInputRef.current) fileInputRef.current.value = '';
+    }
+  };
+
   const handleSendMessage = async () => {
-    if (!messageText.trim() || !selectedChat || !currentUser) return;
+    if ((!messageText.trim() && pendingAttachments.length === 0) || !selectedChat || !currentUser) return;
 
     try {
-      const response = await fetch(API_MESSAGES, {
+      const response = await apiFetch(API_MESSAGES, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           chat_id: selectedChat.id,
-          sender_id: currentUser.user_id,
           text: messageText,
+          attachment_ids: pendingAttachments.map((attachment) => attachment.id),
         }),
       });
 
       if (response.ok) {
         setMessageText('');
+        setPendingAttachments([]);
         loadMessages(selectedChat.id);
         loadChats(currentUser.user_id);
       }
@@ -175,9 +200,9 @@ const Index = () => {
     if (!userSearchQuery.trim()) return;
     
     try {
-      const response = await fetch(API_CHATS, {
+      const response = await apiFetch(API_CHATS, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({ action: 'search_users', query: userSearchQuery }),
       });
 
@@ -204,15 +229,14 @@ const Index = () => {
     }
 
     try {
-      const response = await fetch(API_CHATS, {
+      const response = await apiFetch(API_CHATS, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'create_chat',
           type: newChatType,
           name: newChatName || null,
           description: newChatDesc || null,
-          created_by: currentUser.user_id,
           member_ids: selectedUsers,
         }),
       });
@@ -267,7 +291,7 @@ const Index = () => {
   }
 
   if (view === 'admin') {
-    return <Admin onBack={() => setView('chats')} currentUser={currentUser} />;
+    return <Admin onBack={() => setView('chats')} />;
   }
 
   if (view === 'auth') {
@@ -412,7 +436,10 @@ const Index = () => {
                       <span className="text-xs text-gray-500 mb-1 px-2">{msg.display_name}</span>
                     )}
                     <div className={`rounded-2xl px-4 py-2 ${isOwn ? 'bg-blue-500 text-white' : 'bg-white'}`}>
-                      <p className="text-sm whitespace-pre-wrap break-words">{msg.text}</p>
+                      {msg.text && <p className="text-sm whitespace-pre-wrap break-words">{msg.text}</p>}
+                      {msg.attachments?.map((attachment) => (
+                        <AttachmentView key={attachment.id} api={API_MESSAGES} attachment={attachment} />
+                      ))}
                     </div>
                     <span className="text-xs text-gray-400 mt-1 px-2">{formatTime(msg.created_at)}</span>
                   </div>
@@ -423,7 +450,23 @@ const Index = () => {
         </ScrollArea>
 
         <div className="p-4 bg-white border-t">
+          {pendingAttachments.length > 0 && (
+            <div className="flex flex-wrap gap-2 mb-2">
+              {pendingAttachments.map((attachment) => (
+                <Badge key={attachment.id} variant="secondary">{attachment.name}</Badge>
+              ))}
+            </div>
+          )}
           <div className="flex gap-2">
+            <input
+              ref={fileInputRef}
+              type="file"
+              className="hidden"
+              onChange={(e) => handleAttachFile(e.target.files?.[0])}
+            />
+            <Button variant="ghost" size="icon" onClick={() => fileInputRef.current?.click()}>
+              <Icon name="Paperclip" className="w-5 h-5" />
+            </Button>
             <Input
               placeholder="Сообщение..."
               value={messageText}
@@ -7,6 +7,7 @@ import Icon from '@/components/ui/icon';
 import { useToast } from '@/hooks/use-toast';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
+import { apiFetch, authHeaders, withSenders } from '@/lib/session';
 
 const API_SUPPORT = 'https://functions.poehali.dev/a6c5b7a0-809f-4c1e-8745-26b11f71e3de';
 
@@ -29,11 +30,10 @@ type SupportMessage = {
 };
 
 type SupportProps = {
-  userId: number;
   onBack: () => void;
 };
 
-export default function Support({ userId, onBack }: SupportProps) {
+export default function Support({ onBack }: SupportProps) {
   const { toast } = useToast();
   const [view, setView] = useState<'list' | 'create' | 'chat'>('list');
   const [tickets, setTickets] = useState<Ticket[]>([]);
@@ -57,7 +57,7 @@ export default function Support({ userId, onBack }: SupportProps) {
 
   const loadTickets = async () => {
     try {
-      const response = await fetch(`${API_SUPPORT}?action=tickets&user_id=${userId}`);
+      const response = await apiFetch(`${API_SUPPORT}?action=tickets&mine=1`, { headers: authHeaders() });
       const data = await response.json();
       if (response.ok) {
         setTickets(data);
@@ -69,10 +69,10 @@ export default function Support({ userId, onBack }: SupportProps) {
 
   const loadMessages = async (ticketId: number) => {
     try {
-      const response = await fetch(`${API_SUPPORT}?action=messages&ticket_id=${ticketId}`);
+      const response = await apiFetch(`${API_SUPPORT}?action=messages&ticket_id=${ticketId}&view=compact`, { headers: authHeaders() });
       const data = await response.json();
       if (response.ok) {
-        setMessages(data);
+        setMessages(withSenders(data));
       }
     } catch (error) {
       console.error('Failed to load messages', error);
@@ -86,12 +86,11 @@ export default function Support({ userId, onBack }: SupportProps) {
     }
 
     try {
-      const response = await fetch(API_SUPPORT, {
+      const response = await apiFetch(API_SUPPORT, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'create_ticket',
-          user_id: userId,
           subject,
           message: firstMessage,
         }),
@@ -113,13 +112,12 @@ export default function Support({ userId, onBack }: SupportProps) {
     if (!messageText.trim() || !selectedTicket) return;
 
     try {
-      const response = await fetch(API_SUPPORT, {
+      const response = await apiFetch(API_SUPPORT, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           action: 'send_message',
           ticket_id: selectedTicket.id,
-          sender_id: userId,
           message: messageText,
           is_admin_reply: false,
         }),